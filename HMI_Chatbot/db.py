@@ -0,0 +1,95 @@
+"""Pooled access to users.db for rag_gui_api, its job scheduler, blob store and result cache.
+
+Connections are opened once and reused instead of per query, the database
+runs in WAL mode so readers never wait for the job scheduler's writes, and
+the ``*_async`` helpers run the query on the thread pool so a slow disk
+never blocks the event loop.
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from starlette.concurrency import run_in_threadpool
+
+
+def add_missing_columns(conn, table, columns):
+    """Add the ``(name, declaration)`` columns a table created by an older version lacks."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, declaration in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+
+class Database:
+
+    def __init__(self, db_path, pool_size=8):
+        self.db_path = db_path
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a power loss can only drop the last commits, never corrupt the file.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self, row_factory=None):
+        """Borrow a connection; the block runs as one transaction."""
+        with self._slots:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._open()
+            conn.row_factory = row_factory
+            try:
+                with conn:
+                    yield conn
+            finally:
+                with self._lock:
+                    self._idle.append(conn)
+
+    def fetchone(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).rowcount
+
+    async def fetchone_async(self, sql, params=()):
+        return await run_in_threadpool(self.fetchone, sql, params)
+
+    async def fetchall_async(self, sql, params=()):
+        return await run_in_threadpool(self.fetchall, sql, params)
+
+    async def execute_async(self, sql, params=()):
+        return await run_in_threadpool(self.execute, sql, params)
+
+
+class TTLCache:
+    """A small dict whose entries expire ``ttl`` seconds after they were set."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return entry[0]
+
+    def set(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
@@ -0,0 +1,87 @@
+"""Serving generated files with HTTP Range, ETag and Cache-Control support.
+
+A video element asks for byte ranges: with a faststart MP4 (moov atom first,
+see save_video_with_watermark) the first request for a few hundred KB is
+enough to start playback, and seeking fetches only the part that is needed.
+Every file under uploads/ is written once and never changed in place, so a
+validator built from size and mtime is a safe ETag and clients may keep
+them for a long time.
+"""
+import mimetypes
+import os
+
+from starlette.responses import Response, StreamingResponse
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+CHUNK_SIZE = 256 * 1024
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def _etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single ``bytes=`` range, None to send the whole file, or ValueError."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # Multiple ranges are legal to ignore; the full body is a valid answer.
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        length = int(last)
+        if length <= 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path):
+    stat = os.stat(path)
+    etag = _etag(stat)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, stat.st_size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    # If-Range: only honour the range when the client's copy is still current.
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            requested = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        if requested:
+            start, end = requested
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD" or stat.st_size == 0:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(_read_range(path, start, end), status_code=status_code, headers=headers, media_type=media_type)
@@ -0,0 +1,46 @@
+"""Weighted fair sharing of the job scheduler between users.
+
+Start-time fair queuing: every user has a virtual time that advances by the
+cost of each job started for them divided by their weight.  The next job is
+taken from the waiting user with the smallest virtual time, so a user who
+submits dozens of jobs gets the same share of the slots as one who submits a
+single job, and a user with weight 2 gets twice the share of a user with
+weight 1.  A user who comes back after being idle starts at the current
+virtual time instead of cashing in the idle period.
+"""
+import threading
+
+
+class FairShare:
+
+    def __init__(self, weight=None):
+        self.weight = weight or (lambda user_id: 1.)  # user_id -> share weight
+        self._virtual_time = 0.
+        self._users = {}  # user_id -> virtual time, only users ahead of the global virtual time
+        self._lock = threading.Lock()
+
+    def _start(self, user_id):
+        return max(self._users.get(user_id, 0.), self._virtual_time)
+
+    def pick(self, candidates):
+        """The candidate to start next.
+
+        ``candidates`` are job rows in the order each user's own jobs should run;
+        only the first of each user is considered.
+        """
+        heads = {}
+        for job in candidates:
+            heads.setdefault(job["user_id"], job)
+        with self._lock:
+            # min() keeps the earliest of equal users, so ties follow the candidates' order.
+            return min(heads.values(), key=lambda job: self._start(job["user_id"]), default=None)
+
+    def charge(self, user_id, cost):
+        """Account for a job of ``cost`` (expected seconds of work) started for ``user_id``."""
+        weight = max(self.weight(user_id) or 1., 1e-3)
+        with self._lock:
+            start = self._start(user_id)
+            self._virtual_time = start
+            self._users[user_id] = start + cost / weight
+            # Users at or behind the virtual time are indistinguishable from new ones.
+            self._users = {user: vt for user, vt in self._users.items() if vt > self._virtual_time}
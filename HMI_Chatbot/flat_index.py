@@ -0,0 +1,158 @@
+"""Compact in-process vector index for rag_store.
+
+A document of a few hundred pages gives a few thousand chunks, for which a
+Chroma collection (SQLite, HNSW graph, a client per collection) is far more
+machinery than needed.  FlatIndex keeps the normalised chunk vectors as one
+float16 matrix in ``vectors.npy`` and answers a query with a dot product
+against it.  Small indexes are held in memory as float32; larger ones are
+memory-mapped and scored block by block, so the float32 working copy stays
+small.
+
+Large collections can be partitioned (IVF): the vectors are clustered with
+spherical k-means, stored grouped by cluster, and a query only scores the
+``nprobe`` clusters whose centroids are closest to it.
+
+``as_retriever()`` returns a langchain retriever, so the index is a drop-in
+replacement for ``vectordb.as_retriever()`` in rag.py.
+"""
+import os
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+BLOCK_ROWS = 65536
+# Indexes up to this size are kept in memory as float32 instead of converting memmap blocks per query.
+RESIDENT_BYTES = 64 * 1024 * 1024
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.
+    return vectors / norms
+
+
+def _merge_top_k(best_scores, best_rows, scores, rows, k):
+    """Keep the ``k`` highest of the running best and a new block, per query (unsorted)."""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    rows = np.concatenate([best_rows, rows], axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    return scores, rows
+
+
+def _assign(vectors, centroids):
+    """Closest centroid of every vector."""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def spherical_kmeans(vectors, lists, iterations=10, seed=0):
+    """(centroids, assignment) of unit ``vectors`` clustered into ``lists`` partitions by cosine similarity."""
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(len(vectors), lists, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        assignment = _assign(vectors, centroids)
+        for cluster in range(lists):
+            members = vectors[assignment == cluster]
+            if len(members):
+                centroids[cluster] = _normalize(members.mean(axis=0))
+    return centroids, _assign(vectors, centroids)
+
+
+class FlatIndex:
+
+    def __init__(self, vectors, documents, embeddings, order=None, centroids=None, offsets=None, nprobe=8):
+        self.vectors = vectors  # (n, dim) unit vectors, row i is documents[order[i]]
+        self.documents = documents
+        self.embeddings = embeddings
+        self.order = order
+        self.centroids = centroids
+        self.offsets = offsets  # cluster c holds rows offsets[c]:offsets[c + 1]
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, documents, embeddings, path, dtype=np.float16, ivf_lists=0, nprobe=8):
+        """Embed ``documents`` and write the index to the directory ``path``."""
+        vectors = embeddings.embed_documents([doc.page_content for doc in documents])
+        cls.write(np.asarray(vectors, dtype=np.float32).reshape(len(documents), -1), path, dtype, ivf_lists)
+        return cls.load(path, documents, embeddings, nprobe)
+
+    @staticmethod
+    def write(vectors, path, dtype=np.float16, ivf_lists=0):
+        vectors = _normalize(vectors)
+        os.makedirs(path, exist_ok=True)
+        if ivf_lists and len(vectors) > ivf_lists:
+            centroids, assignment = spherical_kmeans(vectors, ivf_lists)
+            order = np.argsort(assignment, kind="stable")
+            offsets = np.searchsorted(assignment[order], np.arange(ivf_lists + 1))
+            np.savez(os.path.join(path, "ivf.npz"), centroids=centroids, offsets=offsets, order=order)
+            vectors = vectors[order]
+        np.save(os.path.join(path, "vectors.npy"), vectors.astype(dtype))
+
+    @classmethod
+    def load(cls, path, documents, embeddings, nprobe=8):
+        """Open an index written by ``write``; ``documents`` are the chunks in their original order."""
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        if vectors.size * 4 <= RESIDENT_BYTES:
+            vectors = np.asarray(vectors, dtype=np.float32)
+        ivf_path = os.path.join(path, "ivf.npz")
+        if not os.path.isfile(ivf_path):
+            return cls(vectors, documents, embeddings)
+        with np.load(ivf_path) as ivf:
+            return cls(vectors, documents, embeddings, ivf["order"], ivf["centroids"], ivf["offsets"], nprobe)
+
+    def search(self, queries, k=4):
+        """(scores, document indices) of the ``k`` most similar chunks for each query vector, best first."""
+        queries = _normalize(np.atleast_2d(queries))
+        k = min(k, len(self.vectors))
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        if self.centroids is None:
+            for start in range(0, len(self.vectors), BLOCK_ROWS):
+                block = np.asarray(self.vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+                rows = np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))
+                best_scores, best_rows = _merge_top_k(best_scores, best_rows, queries @ block.T, rows, k)
+        else:
+            scores, rows = [], []
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.nprobe]
+            for query, clusters in zip(queries, probes):
+                # Clusters are contiguous, so the candidates are read as a few slices of the memmap.
+                ranges = [(self.offsets[c], self.offsets[c + 1]) for c in clusters]
+                candidates = np.concatenate([np.arange(start, end) for start, end in ranges])
+                block = np.concatenate([self.vectors[start:end] for start, end in ranges]).astype(np.float32)
+                candidate_scores = block @ query
+                top = np.argsort(-candidate_scores)[:k]
+                scores.append(np.pad(candidate_scores[top], (0, k - len(top)), constant_values=-np.inf))
+                rows.append(np.pad(candidates[top], (0, k - len(top))))
+            best_scores, best_rows = np.array(scores), np.array(rows)
+        ranked = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, ranked, axis=1)
+        best_rows = np.take_along_axis(best_rows, ranked, axis=1)
+        return best_scores, (self.order[best_rows] if self.order is not None else best_rows)
+
+    def similarity_search_with_score(self, query, k=4):
+        scores, indices = self.search(self.embeddings.embed_query(query), k)
+        return [(self.documents[i], float(score)) for score, i in zip(scores[0], indices[0]) if np.isfinite(score)]
+
+    def similarity_search(self, query, k=4):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def as_retriever(self, search_kwargs=None, **kwargs):
+        return FlatIndexRetriever(index=self, k=(search_kwargs or {}).get("k", 4))
+
+
+class FlatIndexRetriever(BaseRetriever):
+    index: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.index.similarity_search(query, self.k)
@@ -2,7 +2,6 @@ import os
 import sys
 import torch
 import shutil
-import requests
 from time import strftime
 from argparse import ArgumentParser
 
@@ -12,63 +11,17 @@ from src.facerender.animate import AnimateFromCoeff
 from src.generate_batch import get_data
 from src.generate_facerender_batch import get_facerender_data
 from src.utils.init_path import init_path
+from src.utils.avatar_cache import cached_preprocess
+from src.utils.progress import stage, span
+from src.utils.trace import tracing
+from service_clients import get_rag_answer, synthesize_tts_audio
+from media import hls_dir_for, package_hls
 
 
-import uuid
 import sys
 sys.stdout.reconfigure(encoding='utf-8')
 
 
-def synthesize_tts_audio(text, source_lang, target_lang, reference_audio=None):
-    """Send text to TTS API and return generated audio file path."""
-    unique_id = str(uuid.uuid4())
-    tts_audio_path = os.path.join("results/audio", f"tts_output_{unique_id}.wav")
-    
-    try:
-        data = {
-            "text": text,
-            "source_lang": source_lang,
-            "target_lang": target_lang
-        }
-        files = None
-        if reference_audio and os.path.isfile(reference_audio):
-            files = {"reference_audio": open(reference_audio, "rb")}
-
-        response = requests.post("http://localhost:7000/translate-and-speak", data=data, files=files)
-
-        if response.status_code == 200:
-            os.makedirs(os.path.dirname(tts_audio_path), exist_ok=True)
-            with open(tts_audio_path, "wb") as f:
-                f.write(response.content)
-            print(f"✅ Audio synthesized and saved to {tts_audio_path}")
-            return tts_audio_path
-        else:
-            print("❌ TTS API Error:", response.status_code, response.text)
-
-    except Exception as e:
-        print("❌ TTS API request failed:", str(e))
-
-    finally:
-        if files:
-            files["reference_audio"].close()
-
-    return None
-
-
-
-def get_rag_answer(pdf_path, query):
-    with open(pdf_path, "rb") as pdf_file:
-        response = requests.post(
-            "http://localhost:9100/rag-query",
-            data={"query": query},
-            files={"pdf_file": pdf_file}
-        )
-        data = response.json()
-        if "answer" in data and isinstance(data["answer"], dict):
-            return data["answer"].get("result", None)  # ✅ only return the result string
-        return None
-
-
 # def get_rag_answer(pdf_path, query):
 #     print("Hello")
 #     url = "http://localhost:9000/rag-query"
@@ -106,10 +59,37 @@ def get_rag_answer(pdf_path, query):
 
 
 
+_MODEL_CACHE = {}
+
+
+def load_models(args):
+    """Build (or reuse) the SadTalker models for the given size/preprocess settings.
+
+    The models are kept in a module-level cache so a long-lived process (see
+    worker_pool.py) only pays the checkpoint loading cost once per configuration.
+    """
+    key = (args.checkpoint_dir, args.size, args.old_version, 'full' in args.preprocess, args.device)
+    if key not in _MODEL_CACHE:
+        current_root_path = os.path.dirname(os.path.abspath(__file__))
+        sadtalker_paths = init_path(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), args.size, args.old_version, args.preprocess)
+
+        preprocess_model = CropAndExtract(sadtalker_paths, args.device)
+        audio_to_coeff = Audio2Coeff(sadtalker_paths, args.device)
+        animate_from_coeff = AnimateFromCoeff(sadtalker_paths, args.device)
+        _MODEL_CACHE[key] = (preprocess_model, audio_to_coeff, animate_from_coeff)
+    return _MODEL_CACHE[key]
+
+
 def main(args):
+    with tracing(args.trace), span("inference"):
+        return generate(args)
+
+
+def generate(args):
     if args.rag_query and args.rag_document:
         print(" RAG mode: answering query using document...")
-        answer = get_rag_answer(args.rag_document, args.rag_query)
+        with stage("rag"):
+            answer = get_rag_answer(args.rag_document, args.rag_query)
 
         if not answer:
             print(" RAG returned no answer.")
@@ -119,7 +99,8 @@ def main(args):
 
     if not args.driven_audio and args.tts_text:
         print(" TTS text detected. Generating audio...")
-        audio_path = synthesize_tts_audio(args.tts_text, args.source_lang, args.target_lang, args.reference_audio)
+        with stage("tts"):
+            audio_path = synthesize_tts_audio(args.tts_text, args.source_lang, args.target_lang, args.reference_audio)
         if not audio_path:
             print(" Failed to generate audio. Exiting.")
             return
@@ -142,18 +123,15 @@ def main(args):
     ref_eyeblink = args.ref_eyeblink
     ref_pose = args.ref_pose
 
-    current_root_path = os.path.split(sys.argv[0])[0]
-    sadtalker_paths = init_path(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), args.size, args.old_version, args.preprocess)
-
-    preprocess_model = CropAndExtract(sadtalker_paths, device)
-    audio_to_coeff = Audio2Coeff(sadtalker_paths, device)
-    animate_from_coeff = AnimateFromCoeff(sadtalker_paths, device)
+    with span("load_models"):
+        preprocess_model, audio_to_coeff, animate_from_coeff = load_models(args)
 
     first_frame_dir = os.path.join(save_dir, 'first_frame_dir')
     os.makedirs(first_frame_dir, exist_ok=True)
     print(' 3DMM Extraction for source image...')
-    first_coeff_path, crop_pic_path, crop_info = preprocess_model.generate(
-        pic_path, first_frame_dir, args.preprocess, source_image_flag=True, pic_size=args.size)
+    with stage('3dmm'):
+        first_coeff_path, crop_pic_path, crop_info = cached_preprocess(
+            preprocess_model, pic_path, first_frame_dir, args.preprocess, args.size, args.avatar_cache_dir)
 
     if first_coeff_path is None:
         print(" Can't get the coeffs of the input")
@@ -180,17 +158,19 @@ def main(args):
     else:
         ref_pose_coeff_path = None
 
-    batch = get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=args.still)
-    coeff_path = audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
+    with stage('audio2coeff'):
+        batch = get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=args.still)
+        coeff_path = audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
 
     if args.face3dvis:
         from src.face3d.visualize import gen_composed_video
         gen_composed_video(args, device, first_coeff_path, coeff_path, audio_path, os.path.join(save_dir, '3dface.mp4'))
 
-    data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, audio_path,
-                               batch_size, input_yaw_list, input_pitch_list, input_roll_list,
-                               expression_scale=args.expression_scale, still_mode=args.still,
-                               preprocess=args.preprocess, size=args.size)
+    with span("facerender_data"):
+        data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, audio_path,
+                                   batch_size, input_yaw_list, input_pitch_list, input_roll_list,
+                                   expression_scale=args.expression_scale, still_mode=args.still,
+                                   preprocess=args.preprocess, size=args.size)
 
     result = animate_from_coeff.generate(data, save_dir, pic_path, crop_info,
                                          enhancer=args.enhancer, background_enhancer=args.background_enhancer,
@@ -199,11 +179,18 @@ def main(args):
     shutil.move(result, save_dir + '.mp4')
     print(' The generated video is saved as:', save_dir + '.mp4')
 
+    if args.hls:
+        with stage('mux'):
+            playlist = package_hls(save_dir + '.mp4', hls_dir_for(save_dir + '.mp4'))
+        print(' HLS playlist:', playlist)
+
     if not args.verbose:
         shutil.rmtree(save_dir)
 
+    return save_dir + '.mp4'
 
-if __name__ == '__main__':
+
+def build_parser():
     parser = ArgumentParser()
 
     # SadTalker core
@@ -236,6 +223,9 @@ if __name__ == '__main__':
     parser.add_argument("--still", action="store_true")
     parser.add_argument("--preprocess", default='crop', choices=['crop', 'extcrop', 'resize', 'full', 'extfull'])
     parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--hls", action="store_true", help="also package the video as an adaptive HLS ladder")
+    parser.add_argument("--trace", default=None, help="write a Chrome trace of the run to this JSON file")
+    parser.add_argument("--avatar_cache_dir", default=None, help="reuse the 3DMM extraction of source images seen before")
     parser.add_argument("--old_version", action="store_true")
 
     parser.add_argument('--net_recon', type=str, default='resnet50')
@@ -248,8 +238,11 @@ if __name__ == '__main__':
     parser.add_argument('--camera_d', type=float, default=10.)
     parser.add_argument('--z_near', type=float, default=5.)
     parser.add_argument('--z_far', type=float, default=15.)
+    return parser
 
-    args = parser.parse_args()
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
     args.device = "cuda" if torch.cuda.is_available() and not args.cpu else "cpu"
 
     main(args)
@@ -0,0 +1,85 @@
+"""Live job progress for the /events server-sent event stream.
+
+The worker pool and the scheduler publish raw events from their own threads;
+the hub folds them into one snapshot per job (status, stage, percent, ETA) and
+pushes every change to the asyncio queues of the connected clients.
+"""
+import asyncio
+import time
+from collections import defaultdict
+
+from src.utils.progress import overall_percent
+
+TERMINAL_STATES = ("completed", "error", "cancelled")
+KEEPALIVE_SECONDS = 15
+
+
+class ProgressHub:
+
+    def __init__(self):
+        self._loop = None
+        self._subscribers = defaultdict(set)
+        self._latest = {}
+        self._started = {}
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def publish(self, job_id, event):
+        """Thread-safe entry point for the worker pool and the scheduler."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._dispatch, job_id, event)
+
+    def _dispatch(self, job_id, event):
+        snapshot = self._latest.setdefault(job_id, {"status": "running", "stage": None, "percent": 0., "eta_seconds": None})
+        if event["type"] == "state":
+            snapshot.update({k: v for k, v in event.items() if k != "type"})
+            if event["status"] == "running":
+                self._started.setdefault(job_id, time.time())
+            if event["status"] == "completed":
+                snapshot["percent"] = 100.
+                snapshot["eta_seconds"] = 0
+        else:
+            fraction = event.get("fraction", 0.) if event["type"] == "progress" else 0.
+            if event["type"] == "stage" and event["state"] == "end":
+                fraction = 1.
+            snapshot["stage"] = event["stage"]
+            snapshot["percent"] = max(snapshot["percent"], overall_percent(event["stage"], fraction))
+            started = self._started.setdefault(job_id, time.time())
+            if snapshot["percent"] > 0:
+                elapsed = time.time() - started
+                snapshot["eta_seconds"] = round(elapsed * (100 - snapshot["percent"]) / snapshot["percent"])
+
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(dict(snapshot))
+        if snapshot["status"] in TERMINAL_STATES:
+            self._latest.pop(job_id, None)
+            self._started.pop(job_id, None)
+
+    def current(self, job_id):
+        return dict(self._latest.get(job_id, {}))
+
+    async def subscribe(self, job_id, load_snapshot):
+        """Yield snapshots until the job reaches a terminal state (None means keep-alive).
+
+        ``load_snapshot`` reads the persisted state; it is called after the queue is
+        registered so no transition can slip between the two, on the default
+        executor so the database read does not block the event loop.
+        """
+        queue = asyncio.Queue()
+        self._subscribers[job_id].add(queue)
+        try:
+            snapshot = await asyncio.get_running_loop().run_in_executor(None, load_snapshot)
+            snapshot.update(self.current(job_id))
+            yield snapshot
+            while snapshot["status"] not in TERMINAL_STATES:
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield snapshot
+        finally:
+            self._subscribers[job_id].discard(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
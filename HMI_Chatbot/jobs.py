@@ -0,0 +1,454 @@
+"""Durable job queue for rag_gui_api.
+
+Jobs are rows in the ``jobs`` table of users.db, so queued work and finished
+results survive a restart of the server.  A single scheduler thread moves jobs
+through every state (queued -> preparing -> ready -> running -> completed |
+error | cancelled) and records the transitions with timestamps.
+
+While preparing, the RAG answer and its speech are produced on a small thread
+pool in this process.  Their audio length is the expected cost of the render
+(SadTalker renders a fixed number of frames per second of audio), so ready
+jobs are rendered shortest first, at most ``max_per_device`` at a time per
+device.  Waiting earns a job ``aging_rate`` seconds of credit per second, so a
+long answer is not starved by a stream of short ones.
+
+Past the queue-depth or wait thresholds of its DegradePolicy the scheduler
+renders newly admitted jobs at reduced quality and records the steps taken
+in the ``degraded`` column (see load_shedding.py).
+
+A job whose inputs match one already in flight is coalesced into it: it never
+runs itself and completes with its own copy of the leader's result.
+
+The same estimate of the backlog gives the expected completion time of a new
+job (estimate_seconds), which rag_gui_api uses to turn work away with a 429
+instead of letting the queue grow without bound.
+
+Jobs are admitted by priority class first (interactive before batch) and batch
+jobs may only hold ``batch_slots`` renders per device, so a bulk submission
+cannot occupy every slot.  Within a class, preparation and render slots are
+shared fairly between users (fair_share.py, weighted by ``weight``): the
+ordering above only decides which of a user's own jobs goes next.  Queued or
+running jobs can be cancelled.
+"""
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from db import add_missing_columns
+from fair_share import FairShare
+from load_shedding import DegradePolicy, ThroughputEstimator
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Columns introduced after the first version of the table, added in place on start-up.
+ADDED_COLUMNS = [
+    ("stage", "TEXT"),
+    ("progress", "REAL"),
+    ("image_sha", "TEXT"),
+    ("pdf_sha", "TEXT"),
+    ("audio_sha", "TEXT"),
+    ("size", "INTEGER"),
+    ("preprocess", "TEXT"),
+    ("result_key", "TEXT"),
+    ("coalesced_into", "TEXT"),
+    ("priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("answer", "TEXT"),
+    ("driven_audio", "TEXT"),
+    ("audio_seconds", "REAL"),
+    ("ready_at", "REAL"),
+    ("hls", "INTEGER NOT NULL DEFAULT 0"),
+    ("playlist_url", "TEXT"),
+    ("background_enhancer", "TEXT"),
+    ("degraded", "TEXT"),
+    ("batch_id", "TEXT"),
+]
+
+IN_FLIGHT_STATES = ("queued", "preparing", "ready", "running")
+
+
+def init_jobs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            state TEXT NOT NULL,
+            device TEXT,
+            query TEXT,
+            image_path TEXT,
+            pdf_path TEXT,
+            audio_path TEXT,
+            image_sha TEXT,
+            pdf_sha TEXT,
+            audio_sha TEXT,
+            enhancer TEXT,
+            background_enhancer TEXT,
+            size INTEGER,
+            preprocess TEXT,
+            hls INTEGER NOT NULL DEFAULT 0,
+            result_key TEXT,
+            coalesced_into TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            degraded TEXT,
+            answer TEXT,
+            driven_audio TEXT,
+            audio_seconds REAL,
+            result_dir TEXT,
+            url TEXT,
+            playlist_url TEXT,
+            error TEXT,
+            stage TEXT,
+            progress REAL,
+            created_at REAL,
+            ready_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    """)
+    add_missing_columns(conn, "jobs", ADDED_COLUMNS)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, priority, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_result_key ON jobs(result_key, state)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_coalesced_into ON jobs(coalesced_into)")
+
+
+def _connect(db):
+    return db.connection(sqlite3.Row)
+
+
+def _insert_job(conn, job_id, user_id, fields):
+    fields = {"id": job_id, "user_id": user_id, "state": "queued", "created_at": time.time(), **fields}
+    columns = ", ".join(fields)
+    placeholders = ", ".join("?" for _ in fields)
+    conn.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", tuple(fields.values()))
+
+
+def create_job(db, job_id, user_id, **fields):
+    """Insert a queued job; ``fields`` are column values (query, image_path, image_sha, ...)."""
+    with _connect(db) as conn:
+        _insert_job(conn, job_id, user_id, fields)
+
+
+def create_or_attach_job(db, job_id, user_id, **fields):
+    """Like create_job, but attach to an in-flight job with the same result_key.
+
+    Returns the id of the job it was attached to, or None when it will run itself.
+    """
+    with _connect(db) as conn:
+        # Look up and insert in one write transaction so two identical requests cannot both lead.
+        conn.execute("BEGIN IMMEDIATE")
+        leader_id = _find_leader(conn, fields.get("result_key"))
+        _insert_job(conn, job_id, user_id, {"coalesced_into": leader_id, **fields})
+    return leader_id
+
+
+def _find_leader(conn, key):
+    leader = conn.execute("""
+        SELECT id FROM jobs
+        WHERE result_key = ? AND state IN ('queued', 'preparing', 'ready', 'running') AND coalesced_into IS NULL
+        ORDER BY created_at LIMIT 1
+    """, (key,)).fetchone()
+    return leader["id"] if leader else None
+
+
+def find_in_flight_job(db, key):
+    """Id of the in-flight job a new job with result_key ``key`` would be coalesced into, or None."""
+    with _connect(db) as conn:
+        return _find_leader(conn, key)
+
+
+def get_job(db, job_id):
+    with _connect(db) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def count_jobs_by_state(db):
+    """Number of unfinished jobs per state (coalesced jobs excluded, they add no work)."""
+    with _connect(db) as conn:
+        rows = conn.execute("""
+            SELECT state, COUNT(*) FROM jobs
+            WHERE state IN ('queued', 'preparing', 'ready', 'running') AND coalesced_into IS NULL
+            GROUP BY state
+        """).fetchall()
+    counts = dict.fromkeys(IN_FLIGHT_STATES, 0)
+    counts.update({state: count for state, count in rows})
+    return counts
+
+
+def update_job(db, job_id, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with _connect(db) as conn:
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+class JobScheduler:
+    """Prepares queued jobs and feeds ready ones into the worker pool, at most ``max_per_device`` at a time per device."""
+
+    def __init__(self, db, pool, prepare, on_complete, max_per_device=1, on_state=None, batch_slots=None,
+                 prep_workers=2, aging_rate=0.5, policy=None, estimator=None, weight=None, render_options=None):
+        self.db = db
+        self.pool = pool
+        self.prepare = prepare  # job -> {"answer", "driven_audio", "audio_seconds"}
+        self.on_complete = on_complete  # (job, video_path) -> {"url": ..., other result columns}
+        self.on_state = on_state  # (job_id, event) -> None
+        self.max_per_device = max_per_device
+        self.render_options = render_options or {}  # passed to every render, e.g. avatar_cache_dir
+        # Keep one slot per device free of batch work whenever there is more than one.
+        self.batch_slots = batch_slots or max(1, max_per_device - 1)
+        self.prep_workers = prep_workers
+        self.aging_rate = aging_rate
+        self.policy = policy or DegradePolicy()
+        self.estimator = estimator or ThroughputEstimator()
+        # Separate virtual clocks: preparation and rendering are different resources.
+        self._prep_share = FairShare(weight)  # weight: user_id -> share weight
+        self._render_share = FairShare(weight)
+        self._running = {device: {} for device in pool.devices}  # device -> {job_id: priority}
+        self._preparing = {}  # job_id -> start time
+        self._prep_executor = ThreadPoolExecutor(max_workers=prep_workers, thread_name_prefix="job-prep")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        with _connect(self.db) as conn:
+            # Renders that were in flight when the server stopped are lost with their worker,
+            # but their answer and audio are kept; unfinished preparation starts over.
+            conn.execute("""
+                UPDATE jobs SET state = 'ready', device = NULL, started_at = NULL
+                WHERE state = 'running' AND driven_audio IS NOT NULL
+            """)
+            conn.execute("""
+                UPDATE jobs SET state = 'queued', device = NULL, started_at = NULL
+                WHERE state IN ('preparing', 'running')
+            """)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        self._prep_executor.shutdown(wait=False)
+
+    def notify(self):
+        self._wake.set()
+
+    def _publish(self, job_id, status, **fields):
+        if self.on_state:
+            self.on_state(job_id, {"type": "state", "status": status, **fields})
+
+    def _loop(self):
+        while not self._stopped:
+            try:
+                self._admit()
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(timeout=5)
+            self._wake.clear()
+
+    def _claim(self, select, params, share, cost, from_state, to_state, **fields):
+        """Claim the job ``share`` picks among the ``select`` rows of the most urgent priority class."""
+        assignments = "".join(f", {name} = ?" for name in fields)
+        while True:
+            with _connect(self.db) as conn:
+                rows = conn.execute(select, params).fetchall()
+            if not rows:
+                return None
+            # Picked between the two queries: the share weights are read from the pool too.
+            row = share.pick([row for row in rows if row["priority"] == rows[0]["priority"]])
+            with _connect(self.db) as conn:
+                claimed = conn.execute(
+                    f"UPDATE jobs SET state = ?{assignments} WHERE id = ? AND state = ?",
+                    (to_state, *fields.values(), row["id"], from_state)
+                ).rowcount
+            if claimed:
+                share.charge(row["user_id"], cost(row))
+                return dict(row)
+
+    def _claim_for_prep(self):
+        return self._claim("""
+            SELECT * FROM jobs
+            WHERE state = 'queued' AND coalesced_into IS NULL
+            ORDER BY priority, created_at
+        """, (), self._prep_share, lambda job: self.estimator.prep_seconds, "queued", "preparing")
+
+    def _claim_next(self, device, max_priority):
+        # Per user: shortest expected job first, each second of waiting taking aging_rate seconds off the audio length.
+        return self._claim("""
+            SELECT * FROM jobs
+            WHERE state = 'ready' AND coalesced_into IS NULL AND priority <= ?
+            ORDER BY priority, COALESCE(audio_seconds, 0) - ? * (? - ready_at), created_at
+        """, (max_priority, self.aging_rate, time.time()), self._render_share,
+            lambda job: self.estimator.render_seconds(job["audio_seconds"]),
+            "ready", "running", device=device, started_at=time.time())
+
+    def _admit(self):
+        # Callbacks are attached once the lock is released: a future that has already
+        # finished (e.g. prepare failing on a refused connection) runs them inline.
+        submitted = []
+        with self._lock:
+            while len(self._preparing) < self.prep_workers:
+                job = self._claim_for_prep()
+                if job is None:
+                    break
+                self._preparing[job["id"]] = time.time()
+                self._publish(job["id"], "preparing")
+                future = self._prep_executor.submit(self.prepare, job)
+                submitted.append((future, lambda f, job=job: self._prepared(job, f)))
+
+            level = None
+            admitted = True
+            while admitted:
+                admitted = False
+                for device, running in self._running.items():
+                    if len(running) >= self.max_per_device:
+                        continue
+                    batch_running = sum(1 for priority in running.values() if priority >= PRIORITIES["batch"])
+                    max_priority = PRIORITIES["batch"] if batch_running < self.batch_slots else PRIORITIES["interactive"]
+                    job = self._claim_next(device, max_priority)
+                    if job is None:
+                        continue
+                    running[job["id"]] = job["priority"]
+                    admitted = True
+
+                    if level is None:
+                        level = self.policy.level(*self.pressure())
+                    options, degraded = self.policy.apply(self._options(job), level)
+                    if degraded:
+                        self._record_degradation(job["id"], options, degraded)
+                        print(f"[{job['id']}] 📉 Degraded under load: {', '.join(degraded)}")
+                    print(f"[{job['id']}] 🚀 Admitted on {device}")
+                    self._publish(job["id"], "running", degraded=degraded)
+                    future = self.pool.submit(job["id"], options, device)
+                    submitted.append((future, lambda f, job=job, device=device, admitted_at=time.time():
+                                      self._finished(job, device, admitted_at, f)))
+        for future, callback in submitted:
+            future.add_done_callback(callback)
+
+    def pressure(self):
+        """(queue depth, expected wait for a render slot in seconds) right now."""
+        with _connect(self.db) as conn:
+            jobs = conn.execute("""
+                SELECT state, audio_seconds, started_at FROM jobs
+                WHERE state IN ('queued', 'preparing', 'ready', 'running') AND coalesced_into IS NULL
+            """).fetchall()
+        depth = sum(1 for job in jobs if job["state"] != "running")
+        slots = len(self._running) * self.max_per_device
+        return depth, self.estimator.backlog_seconds(jobs, slots)
+
+    def estimate_seconds(self, jobs=1):
+        """Expected time until ``jobs`` jobs submitted now are all completed."""
+        slots = len(self._running) * self.max_per_device
+        backlog = self.pressure()[1] + (jobs - 1) * self.estimator.render_seconds() / max(1, slots)
+        return self.estimator.job_seconds(backlog)
+
+    def _record_degradation(self, job_id, options, degraded):
+        # The job row keeps the settings it was actually rendered with.
+        update_job(self.db, job_id, degraded=",".join(degraded), enhancer=options["enhancer"] or "",
+                   background_enhancer=options["background_enhancer"] or "", size=options["size"],
+                   preprocess=options["preprocess"])
+
+    def _prepared(self, job, future):
+        with self._lock:
+            started = self._preparing.pop(job["id"])
+        if future.exception() is not None:
+            self._settle(job, future)
+        else:
+            fields = future.result()
+            self.estimator.observe_prep(time.time() - started, fields["audio_seconds"])
+            with _connect(self.db) as conn:
+                # A job cancelled while preparing stays cancelled, its answer is simply dropped.
+                ready = conn.execute("""
+                    UPDATE jobs SET state = 'ready', answer = ?, driven_audio = ?, audio_seconds = ?, ready_at = ?
+                    WHERE id = ? AND state = 'preparing'
+                """, (fields["answer"], fields["driven_audio"], fields["audio_seconds"], time.time(), job["id"])).rowcount
+            if ready:
+                print(f"[{job['id']}] 🎧 Ready to render ({fields['audio_seconds'] or 0:.1f}s of audio)")
+                self._publish(job["id"], "ready")
+        self.notify()
+
+    def cancel(self, job_id):
+        """Cancel a job that has not finished yet; returns False if it had already finished."""
+        with self._lock:
+            job = get_job(self.db, job_id)
+            if job is None or job["state"] not in IN_FLIGHT_STATES:
+                return False
+            with _connect(self.db) as conn:
+                followers = [row["id"] for row in conn.execute(
+                    "SELECT id FROM jobs WHERE coalesced_into = ? AND state = 'queued' ORDER BY created_at", (job_id,)
+                )]
+                # The job may have finished since it was read: _complete does not take the lock.
+                cancelled = conn.execute(
+                    "UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE id = ? AND state IN ('queued', 'preparing', 'ready', 'running')",
+                    (time.time(), job_id)
+                ).rowcount
+                if not cancelled:
+                    return False
+                if followers and job["state"] != "running":
+                    # Nothing has been rendered yet: the oldest attached job takes over the work,
+                    # together with the answer and audio if they are already there.
+                    state = "ready" if job["state"] == "ready" else "queued"
+                    conn.execute("""
+                        UPDATE jobs SET coalesced_into = NULL, state = ?, answer = ?, driven_audio = ?, audio_seconds = ?, ready_at = ?
+                        WHERE id = ?
+                    """, (state, job["answer"], job["driven_audio"], job["audio_seconds"], job["ready_at"], followers[0]))
+                    conn.execute("UPDATE jobs SET coalesced_into = ? WHERE coalesced_into = ? AND state = 'queued'",
+                                 (followers[0], job_id))
+        # A running job with attached jobs keeps rendering for them; otherwise free its slot now.
+        if job["state"] == "running" and not followers:
+            self.pool.cancel(job_id)
+        print(f"[{job_id}] 🛑 Cancelled")
+        self._publish(job_id, "cancelled")
+        self.notify()
+        return True
+
+    def _options(self, job):
+        return {
+            **self.render_options,
+            "source_image": job["image_path"],
+            "driven_audio": job["driven_audio"],
+            "result_dir": job["result_dir"],
+            "enhancer": job["enhancer"] or None,
+            "background_enhancer": job["background_enhancer"] or None,
+            "size": job["size"] or 256,
+            "preprocess": job["preprocess"] or "crop",
+            "hls": bool(job["hls"]),
+        }
+
+    def _finished(self, job, device, admitted_at, future):
+        with self._lock:
+            self._running[device].pop(job["id"], None)
+        if not future.cancelled() and future.exception() is None:
+            self.estimator.observe_render(time.time() - admitted_at, job["audio_seconds"])
+        self._settle(get_job(self.db, job["id"]), future)
+        self.notify()
+
+    def _settle(self, job, future):
+        with _connect(self.db) as conn:
+            if job["degraded"]:
+                # Attached jobs receive the same degraded video, say so in their rows too.
+                conn.execute("""
+                    UPDATE jobs SET degraded = ?, enhancer = ?, background_enhancer = ?, size = ?, preprocess = ?
+                    WHERE coalesced_into = ? AND state = 'queued'
+                """, (job["degraded"], job["enhancer"], job["background_enhancer"], job["size"], job["preprocess"], job["id"]))
+            followers = [dict(row) for row in conn.execute(
+                "SELECT * FROM jobs WHERE coalesced_into = ? AND state = 'queued'", (job["id"],)
+            )]
+        # Followers are settled before the leader is published, so a client watching the
+        # leader on behalf of a follower finds the follower's own result once it is told.
+        for finished in followers + [job]:
+            self._complete(finished, future)
+
+    def _complete(self, job, future):
+        if get_job(self.db, job["id"])["state"] == "cancelled":
+            return
+        try:
+            result = self.on_complete(job, future.result())
+            update_job(self.db, job["id"], state="completed", progress=100., finished_at=time.time(), **result)
+            self._publish(job["id"], "completed", **result)
+        except Exception as e:
+            print(f"[{job['id']}] ❌ Error:", e)
+            update_job(self.db, job["id"], state="error", error=str(e), finished_at=time.time())
+            self._publish(job["id"], "error", error=str(e))
@@ -0,0 +1,95 @@
+"""Keeping the render queue bounded under load.
+
+ThroughputEstimator learns from finished jobs how long preparation (RAG and
+XTTS) takes and how many seconds of rendering one second of answer audio
+costs, and turns the current queue into an expected wait.  DegradePolicy
+uses the queue depth and that wait to step the quality of newly admitted
+renders down, cheapest sacrifice first.
+"""
+import threading
+import time
+
+# In the order they are given up.
+DEGRADE_STEPS = ("background_enhancer", "enhancer", "size", "preprocess")
+
+
+class ThroughputEstimator:
+    """Exponentially weighted averages of the measured stage throughput."""
+
+    def __init__(self, alpha=0.2, prep_seconds=15., render_factor=10., audio_seconds=20.):
+        self.alpha = alpha
+        self.prep_seconds = prep_seconds  # RAG + XTTS per job
+        self.render_factor = render_factor  # render seconds per second of audio
+        self.audio_seconds = audio_seconds  # typical answer length, for jobs not prepared yet
+        self._lock = threading.Lock()
+
+    def _average(self, current, sample):
+        return (1 - self.alpha) * current + self.alpha * sample
+
+    def observe_prep(self, seconds, audio_seconds):
+        with self._lock:
+            self.prep_seconds = self._average(self.prep_seconds, seconds)
+            if audio_seconds:
+                self.audio_seconds = self._average(self.audio_seconds, audio_seconds)
+
+    def observe_render(self, seconds, audio_seconds):
+        if not audio_seconds:
+            return
+        with self._lock:
+            self.render_factor = self._average(self.render_factor, seconds / audio_seconds)
+
+    def render_seconds(self, audio_seconds=None):
+        return self.render_factor * (audio_seconds or self.audio_seconds)
+
+    def backlog_seconds(self, jobs, slots):
+        """Expected time until a render slot frees up for a new job.
+
+        ``jobs`` are (state, audio_seconds, started_at) of the unfinished jobs doing work.
+        """
+        now = time.time()
+        work = 0.
+        for state, audio_seconds, started_at in jobs:
+            total = self.render_seconds(audio_seconds)
+            work += max(0., total - (now - started_at)) if state == "running" and started_at else total
+        return work / max(1, slots)
+
+    def job_seconds(self, backlog_seconds):
+        """Expected completion time of a job submitted now."""
+        return self.prep_seconds + backlog_seconds + self.render_seconds()
+
+
+class DegradePolicy:
+    """Arms step ``i`` of DEGRADE_STEPS once the queue depth reaches ``queue_depths[i]``
+    or the expected wait reaches ``eta_seconds[i]``; missing thresholds never arm."""
+
+    def __init__(self, queue_depths=(), eta_seconds=()):
+        self.queue_depths = tuple(queue_depths)
+        self.eta_seconds = tuple(eta_seconds)
+
+    def level(self, depth, eta):
+        level = 0
+        for step in range(len(DEGRADE_STEPS)):
+            by_depth = step < len(self.queue_depths) and depth >= self.queue_depths[step]
+            by_eta = step < len(self.eta_seconds) and eta >= self.eta_seconds[step]
+            if by_depth or by_eta:
+                level = step + 1
+        return level
+
+    def apply(self, options, level):
+        """Return the render options with the first ``level`` steps applied and the steps that changed something."""
+        options = dict(options)
+        applied = []
+        for step in DEGRADE_STEPS[:level]:
+            if step == "background_enhancer" and options.get("background_enhancer"):
+                options["background_enhancer"] = None
+            elif step == "enhancer" and options.get("enhancer"):
+                options["enhancer"] = None
+            elif step == "size" and options.get("size", 256) > 256:
+                options["size"] = 256
+            elif step == "preprocess" and "full" in options.get("preprocess", ""):
+                # Skips the seamlessClone paste-back onto the full image.
+                options["preprocess"] = options["preprocess"].replace("full", "crop")
+            else:
+                continue
+            applied.append(step)
+        return options, applied
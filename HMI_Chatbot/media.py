@@ -0,0 +1,91 @@
+"""ffmpeg helpers for finished videos (poster frames, durations, HLS).
+
+Kept apart from src/utils/videoio.py so the API process does not import the
+SadTalker pipeline (cv2, torch) just to inspect an MP4.
+"""
+import os
+import shutil
+import subprocess
+
+
+def probe_duration(video):
+    """Duration of ``video`` in seconds according to ffprobe, None if it cannot be read."""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+           "-of", "default=noprint_wrappers=1:nokey=1", video]
+    try:
+        return float(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def save_poster(video, poster_path, at_seconds=0.5, width=480):
+    """Grab one frame of ``video`` as a JPEG poster; returns False if ffmpeg fails."""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-ss", str(at_seconds), "-i", video,
+           "-frames:v", "1", "-vf", f"scale={width}:-2", "-q:v", "4", poster_path]
+    try:
+        subprocess.run(cmd, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return os.path.exists(poster_path)
+
+
+# Renditions as a fraction of the source height, smallest rungs dropped below MIN_HLS_HEIGHT.
+HLS_LADDER = (1.0, 0.75, 0.5)
+MIN_HLS_HEIGHT = 144
+HLS_SEGMENT_SECONDS = 2
+# Roughly 0.08 bits per pixel per frame for talking-head content at 25 fps.
+BITS_PER_PIXEL = 0.08
+
+
+def hls_dir_for(video):
+    return os.path.splitext(video)[0] + "_hls"
+
+
+def probe_size(video):
+    """(width, height) of the first video stream, None if it cannot be read."""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height",
+           "-of", "csv=s=x:p=0", video]
+    try:
+        width, height = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip().split("x")[:2]
+        return int(width), int(height)
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def package_hls(video, out_dir, fps=25):
+    """Package ``video`` as an HLS ladder in ``out_dir``; returns the master playlist path or None."""
+    size = probe_size(video)
+    if size is None:
+        return None
+    width, height = size
+    rungs = [int(height * scale) // 2 * 2 for scale in HLS_LADDER]
+    rungs = [h for h in rungs if h >= MIN_HLS_HEIGHT] or [height // 2 * 2]
+
+    split = "".join(f"[v{i}]" for i in range(len(rungs)))
+    filters = [f"[0:v]split={len(rungs)}{split}"]
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", video]
+    outputs = []
+    for i, rung_height in enumerate(rungs):
+        filters.append(f"[v{i}]scale=-2:{rung_height}[v{i}out]")
+        kbps = max(64, int(width * rung_height / height * rung_height * fps * BITS_PER_PIXEL / 1000))
+        outputs += ["-map", f"[v{i}out]", f"-c:v:{i}", "libx264", f"-b:v:{i}", f"{kbps}k",
+                    f"-maxrate:v:{i}", f"{int(kbps * 1.1)}k", f"-bufsize:v:{i}", f"{int(kbps * 1.5)}k",
+                    "-map", "0:a:0"]
+    gop = str(fps * HLS_SEGMENT_SECONDS)
+    cmd += ["-filter_complex", ";".join(filters)] + outputs + [
+        "-preset", "veryfast", "-g", gop, "-keyint_min", gop, "-sc_threshold", "0",
+        "-c:a", "aac", "-b:a", "96k",
+        "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(out_dir, "v%v", "seg_%03d.ts"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(f"v:{i},a:{i}" for i in range(len(rungs))),
+        os.path.join(out_dir, "v%v", "index.m3u8"),
+    ]
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        subprocess.run(cmd, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(out_dir, ignore_errors=True)
+        return None
+    master = os.path.join(out_dir, "master.m3u8")
+    return master if os.path.exists(master) else None
@@ -0,0 +1,145 @@
+"""Counters, gauges and latency histograms for the /metrics endpoint.
+
+The values are kept in memory and rendered in the Prometheus text format, so
+any Prometheus-compatible scraper can read them without an extra dependency.
+Stage latencies come from the ``stage`` start/end events the pipeline already
+sends for progress reporting (see src/utils/progress.py).
+"""
+import threading
+from collections import defaultdict
+
+# Seconds; from a short RAG lookup up to a long enhanced render.
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """A value read at scrape time; ``collect`` returns {label values tuple: value}."""
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0., 0])
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', f'{bound:g}')])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self._register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Turns the stage start/end events of each job into ``histogram`` observations."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def observe_event(self, job_id, event):
+        if event["type"] != "stage":
+            return
+        key = (job_id, event["stage"])
+        with self._lock:
+            if event["state"] == "start":
+                self._started[key] = event["time"]
+                return
+            started = self._started.pop(key, None)
+        if started is not None:
+            self.histogram.observe(event["time"] - started, stage=event["stage"])
+
+    def forget(self, job_id):
+        """Drop the open stages of a job that ended without closing them (cancelled, killed worker)."""
+        with self._lock:
+            for key in [key for key in self._started if key[0] == job_id]:
+                del self._started[key]
@@ -0,0 +1,85 @@
+"""Parallel PDF text extraction and chunking for rag_store.
+
+PyPDFLoader extracts the pages one after the other and the splitter then
+runs over all of them on one core, which dominates the ingestion of a large
+manual.  PdfParser hands ranges of pages to a process pool instead: each
+task extracts its pages with pypdf and splits them, and the results are
+yielded in page order as soon as they are done, so the caller can embed the
+first chunks while later pages are still being parsed.
+
+Pages are split independently, exactly like ``split_documents(pages)``, and
+carry the same ``source``/``page`` metadata as PyPDFLoader, so the chunks do
+not depend on how the work was divided.  Short documents are parsed in the
+calling process, where starting the pool would cost more than it saves.
+"""
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+
+def _parse_range(path, first, last, chunk_size, chunk_overlap):
+    """(pages, chunks) of pages ``first`` to ``last - 1``, as (text, metadata) pairs."""
+    reader = PdfReader(path)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    pages, chunks = [], []
+    for number in range(first, last):
+        metadata = {"source": path, "page": number}
+        text = reader.pages[number].extract_text()
+        pages.append((text, metadata))
+        chunks.extend((chunk, metadata) for chunk in splitter.split_text(text))
+    return pages, chunks
+
+
+def _documents(pairs):
+    return [Document(page_content=text, metadata=dict(metadata)) for text, metadata in pairs]
+
+
+class PdfParser:
+
+    def __init__(self, workers=None, chunk_size=512, chunk_overlap=50, pages_per_task=8, min_pages_for_pool=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.pages_per_task = pages_per_task
+        self.min_pages_for_pool = min_pages_for_pool
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned, not forked: the parent holds CUDA state and server threads.
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"))
+            return self._pool
+
+    def iter_batches(self, path):
+        """Yield (pages, chunks) Document lists for consecutive page ranges, in page order."""
+        page_count = len(PdfReader(path).pages)
+        ranges = [(first, min(first + self.pages_per_task, page_count))
+                  for first in range(0, page_count, self.pages_per_task)]
+        if self.workers <= 1 or page_count < self.min_pages_for_pool:
+            for first, last in ranges:
+                pages, chunks = _parse_range(path, first, last, self.chunk_size, self.chunk_overlap)
+                yield _documents(pages), _documents(chunks)
+            return
+        executor = self._executor()
+        futures = [executor.submit(_parse_range, path, first, last, self.chunk_size, self.chunk_overlap)
+                   for first, last in ranges]
+        try:
+            for future in futures:
+                pages, chunks = future.result()
+                yield _documents(pages), _documents(chunks)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
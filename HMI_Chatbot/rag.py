@@ -1,17 +1,20 @@
 from fastapi import FastAPI, UploadFile, Form, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
+import hashlib
+import os
 import tempfile
-import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import Chroma
 from langchain.chains import RetrievalQA
 from langchain_community.llms import Ollama
 from datetime import datetime
 import pytz
 
+from rag_store import IndexStore
+
 timezone = pytz.timezone('Asia/Kolkata')
 
 
@@ -19,14 +22,32 @@ current_time = datetime.now(timezone)
 
 app = FastAPI()
 
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "rag_indexes")
+INDEX_CACHE_BYTES = int(os.environ.get("RAG_INDEX_CACHE_BYTES", str(2 * 1024 ** 3)))
+# "flat" (flat_index.py) or "chroma"; each backend has its own cache entries.
+INDEX_BACKEND = os.environ.get("RAG_INDEX_BACKEND", "flat")
+INGEST_WORKERS = int(os.environ.get("RAG_INGEST_WORKERS", "1"))
+# Processes extracting and splitting the pages of one document; 0 uses every core.
+PARSE_WORKERS = int(os.environ.get("RAG_PARSE_WORKERS", "0")) or None
+
 # Use fast embedding model on GPU
 embeddings = HuggingFaceEmbeddings(
-    model_name="all-MiniLM-L6-v2",
+    model_name=EMBEDDING_MODEL,
     model_kwargs={"device": "cuda"}  # Use GPU
 )
 
 print("🔍 Embedding model device:", embeddings.client.device)
 
+index_store = IndexStore(INDEX_DIR, embeddings, EMBEDDING_MODEL, INDEX_CACHE_BYTES, backend=INDEX_BACKEND,
+                         parse_workers=PARSE_WORKERS)
+
+# Background ingestion started by /documents: document_id -> Future while indexing, error message if it failed.
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+ingesting = {}
+ingest_errors = {}
+ingest_lock = threading.RLock()  # re-entered by a done callback that runs right away
+
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -35,29 +56,108 @@ async def log_requests(request: Request, call_next):
     print(f"📤 Responded with {response.status_code}")
     return response
 
+def save_pdf(pdf_file):
+    """Copy an uploaded PDF to a temporary file, returning its path and SHA-256."""
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        for chunk in iter(lambda: pdf_file.file.read(1024 * 1024), b""):
+            digest.update(chunk)
+            tmp.write(chunk)
+    return tmp.name, digest.hexdigest()
+
+def _ingest_file(pdf_sha256, tmp_path):
+    try:
+        index_store.get(pdf_sha256, tmp_path)
+    finally:
+        os.remove(tmp_path)
+
+def _ingestion_done(pdf_sha256, future):
+    with ingest_lock:
+        ingesting.pop(pdf_sha256, None)
+        if future.exception() is not None:
+            ingest_errors[pdf_sha256] = str(future.exception())
+
+def start_ingest(pdf_file):
+    """Start indexing an upload in the background; returns the document id (the SHA-256 of the PDF) and its Future."""
+    tmp_path, pdf_sha256 = save_pdf(pdf_file)
+    with ingest_lock:
+        future = ingesting.get(pdf_sha256)
+        if future is None and not index_store.has(pdf_sha256):
+            ingest_errors.pop(pdf_sha256, None)
+            future = ingest_executor.submit(_ingest_file, pdf_sha256, tmp_path)
+            ingesting[pdf_sha256] = future
+            future.add_done_callback(lambda f: _ingestion_done(pdf_sha256, f))
+            return pdf_sha256, future
+    os.remove(tmp_path)
+    return pdf_sha256, future
+
+def document_status(document_id):
+    with ingest_lock:
+        if document_id in ingesting:
+            return {"status": "indexing"}
+        if document_id in ingest_errors:
+            return {"status": "error", "error": ingest_errors[document_id]}
+    return {"status": "ready" if index_store.has(document_id) else "unknown"}
+
+def build_qa_chain(vectordb):
+    retriever = vectordb.as_retriever()
+    llm = Ollama(model="mistral")
+    return RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
+
+def resolve_document(document_id, pdf_file):
+    """Vector store for a request that names a registered document or uploads the PDF; None if unknown.
+
+    A document that is still being indexed is waited for.
+    """
+    if pdf_file is not None:
+        document_id, future = start_ingest(pdf_file)
+    else:
+        with ingest_lock:
+            future = ingesting.get(document_id)
+    if future is not None:
+        future.result()
+    return index_store.lookup(document_id) if document_id else None
+
+def unknown_document(document_id):
+    # Also the answer for an evicted document: callers register it again and retry.
+    return JSONResponse(content={"error": f"Unknown document: {document_id}"}, status_code=404)
+
+# The handlers below block (ingestion, LLM calls), so they are plain functions run on FastAPI's thread pool.
+@app.post("/documents")
+def register_document(pdf_file: UploadFile = Form(...), wait: bool = Form(True)):
+    """Ingest a PDF once; later queries pass the returned document_id instead of the file.
+
+    With ``wait=false`` the document is indexed in the background and the answer
+    comes right away; GET /documents/{document_id} tells when it is ready, and a
+    query for it before then waits for the indexing to finish.
+    """
+    try:
+        document_id, future = start_ingest(pdf_file)
+        if future is not None and wait:
+            future.result()
+        return JSONResponse(content={"document_id": document_id, **document_status(document_id)},
+                            status_code=202 if future is not None and not wait else 200)
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.get("/documents/{document_id}")
+def get_document(document_id: str):
+    return {"document_id": document_id, **document_status(document_id)}
+
+
 @app.post("/rag-query")
-async def query_rag(query: str = Form(...), pdf_file: UploadFile = Form(...)):
+def query_rag(query: str = Form(...), document_id: Optional[str] = Form(None), pdf_file: Optional[UploadFile] = Form(None)):
     print("✅ RAG endpoint called")
     print("Called at:", current_time.strftime('%Y-%m-%d %H:%M:%S'))
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            shutil.copyfileobj(pdf_file.file, tmp)
-            tmp_path = tmp.name
-        print("Loaded Now")
-        loader = PyPDFLoader(tmp_path)
-        pages = loader.load()
-
-        from langchain.text_splitter import RecursiveCharacterTextSplitter
-        
-        print("Loaded 2")
-        splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=50)
-        docs = splitter.split_documents(pages)
-        print("Loaded 3")
-        vectordb = Chroma.from_documents(docs, embedding=embeddings)
-        retriever = vectordb.as_retriever()
-        print("Loaded 4")
-        llm = Ollama(model="mistral")
-        qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
+        vectordb = resolve_document(document_id, pdf_file)
+        if vectordb is None:
+            return unknown_document(document_id)
+        qa_chain = build_qa_chain(vectordb)
         result = qa_chain.invoke(query)
         print(result)
         return JSONResponse(content={"answer": result})
@@ -67,3 +167,24 @@ async def query_rag(query: str = Form(...), pdf_file: UploadFile = Form(...)):
         traceback.print_exc()  # 🔍 Shows full error in server logs
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+
+@app.post("/rag-batch-query")
+def query_rag_batch(queries: List[str] = Form(...), document_id: Optional[str] = Form(None), pdf_file: Optional[UploadFile] = Form(None)):
+    """Answer several queries against one document, ingesting it only once."""
+    print(f"✅ RAG batch endpoint called with {len(queries)} queries")
+    try:
+        vectordb = resolve_document(document_id, pdf_file)
+        if vectordb is None:
+            return unknown_document(document_id)
+        qa_chain = build_qa_chain(vectordb)
+        answers = []
+        for query in queries:
+            result = qa_chain.invoke(query)
+            print(result)
+            answers.append(result)
+        return JSONResponse(content={"answers": answers})
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JSONResponse(content={"error": str(e)}, status_code=500)
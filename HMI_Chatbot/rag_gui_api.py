@@ -1,9 +1,26 @@
-from fastapi import FastAPI, Form, File, UploadFile, Request, Response, Depends, Cookie, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Form, File, UploadFile, Request, Response, Depends, Cookie
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import os, shutil, uuid, subprocess, sqlite3, hashlib
-from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+import os, uuid, hashlib, json, asyncio, time, math, threading, weakref
+from typing import Optional, List
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from worker_pool import InferenceWorkerPool, JobCancelled
+from load_shedding import DegradePolicy, ThroughputEstimator
+from jobs import JobScheduler, PRIORITIES, init_jobs_table, create_job, create_or_attach_job, find_in_flight_job, get_job, update_job, count_jobs_by_state
+from job_events import ProgressHub, TERMINAL_STATES
+from uploads import BlobStore, UploadTooLarge, init_blobs_table, save_upload, MAX_IMAGE_BYTES, MAX_DOCUMENT_BYTES, MAX_AUDIO_BYTES
+from retention import StorageCollector, video_paths, remove_path
+from result_cache import ResultCache, init_result_cache_table, result_key, link_or_copy, link_tree
+from delivery import file_response
+from db import Database, TTLCache, add_missing_columns
+from media import probe_duration, save_poster, hls_dir_for, package_hls
+from metrics import Registry, StageTimer
+from service_clients import get_rag_answer, get_rag_answers, register_document, document_status, synthesize_tts_audio, audio_duration
+from src.utils.progress import overall_percent
 
 app = FastAPI()
 
@@ -11,15 +28,55 @@ app = FastAPI()
 UPLOAD_FOLDER = "uploads"
 TEMPLATE_DIR = "templates"
 DB_PATH = "users.db"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+AUTH_CACHE_SECONDS = float(os.environ.get("AUTH_CACHE_SECONDS", "30"))
+VIDEOS_PER_PAGE = 12
+JOB_RETENTION_DAYS = float(os.environ.get("JOB_RETENTION_DAYS", "30"))
+USER_QUOTA_BYTES = int(os.environ.get("USER_QUOTA_BYTES", str(2 * 1024 ** 3)))
+GC_INTERVAL_SECONDS = float(os.environ.get("GC_INTERVAL_SECONDS", "3600"))
+RENDER_DEVICES = os.environ.get("RENDER_DEVICES", "auto").split(",")
+WORKERS_PER_DEVICE = int(os.environ.get("WORKERS_PER_DEVICE", "1"))
+BATCH_SLOTS_PER_DEVICE = int(os.environ.get("BATCH_SLOTS_PER_DEVICE", "0")) or None
+PREP_WORKERS = int(os.environ.get("PREP_WORKERS", "2"))
+RENDER_AGING_RATE = float(os.environ.get("RENDER_AGING_RATE", "0.5"))
+AVATAR_CACHE_DIR = os.path.join(UPLOAD_FOLDER, "avatars")
+MAX_BATCH_QUERIES = int(os.environ.get("MAX_BATCH_QUERIES", "100"))
+# Answers fetched per ingestion of a batch's document; larger batches delay the first answer more.
+RAG_BATCH_SIZE = int(os.environ.get("RAG_BATCH_SIZE", "8"))
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", str(5 * 1024 ** 3)))
+DEGRADE_QUEUE_DEPTHS = [int(v) for v in os.environ.get("DEGRADE_QUEUE_DEPTHS", "6,10,16,24").split(",") if v]
+# A job expected to take longer than this is turned away with 429; 0 accepts everything.
+ADMISSION_MAX_ETA_SECONDS = float(os.environ.get("ADMISSION_MAX_ETA_SECONDS", "1800"))
+# A job whose tab was hidden is cancelled after this long unless its user opens a page again.
+ABANDON_GRACE_SECONDS = float(os.environ.get("ABANDON_GRACE_SECONDS", "30"))
+DEGRADE_ETA_SECONDS = [float(v) for v in os.environ.get("DEGRADE_ETA_SECONDS", "300,600,900,1200").split(",") if v]
+SIZES = (256, 512)
+BACKGROUND_ENHANCERS = ("", "realesrgan")
+PREPROCESS_MODES = ("crop", "extcrop", "resize", "full", "extfull")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-app.mount("/uploads", StaticFiles(directory=UPLOAD_FOLDER), name="uploads")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory=TEMPLATE_DIR)
 
 # --------- DB Setup ---------
+db = Database(DB_PATH, pool_size=DB_POOL_SIZE)
+auth_cache = TTLCache(AUTH_CACHE_SECONDS)
+share_weights = TTLCache(AUTH_CACHE_SECONDS)
+
+# Columns added to users after its first version; share_weight is the user's share
+# of the render slots relative to other users (set by hand, e.g. 2 for a priority account).
+USER_COLUMNS = [
+    ("share_weight", "REAL NOT NULL DEFAULT 1"),
+]
+
+# Columns added to videos after its first version.
+VIDEO_COLUMNS = [
+    ("poster", "TEXT"),
+    ("duration", "REAL"),
+]
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
+    with db.connection() as conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,50 +86,311 @@ def init_db():
                 password TEXT
             )
         """)
+        add_missing_columns(conn, "users", USER_COLUMNS)
         conn.execute("""
             CREATE TABLE IF NOT EXISTS videos (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
                 filename TEXT,
                 query TEXT,
+                poster TEXT,
+                duration REAL,
                 FOREIGN KEY(user_id) REFERENCES users(id)
             )
         """)
+        add_missing_columns(conn, "videos", VIDEO_COLUMNS)
+        # users.username is already indexed by its UNIQUE constraint.
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_user_id ON videos(user_id)")
+        init_jobs_table(conn)
+        init_blobs_table(conn)
+        init_result_cache_table(conn)
 init_db()
 
-video_status = {}  # job_id -> {"status": "pending"|"completed"|"error", "url": str}
+blob_store = BlobStore(os.path.join(UPLOAD_FOLDER, "blobs"), db)
+result_cache = ResultCache(os.path.join(UPLOAD_FOLDER, "cache"), db, RESULT_CACHE_BYTES)
+# Ladders for cache hits are transcoded one at a time, so a burst of hits cannot starve the renders of CPU.
+hls_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hls")
+storage_collector = StorageCollector(db, UPLOAD_FOLDER, blob_store, job_retention=JOB_RETENTION_DAYS * 86400,
+                                     user_quota_bytes=USER_QUOTA_BYTES, interval=GC_INTERVAL_SECONDS,
+                                     avatar_cache_dir=AVATAR_CACHE_DIR)
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
 # --------- Helper ---------
-def get_user_by_username(username: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        return conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
-
-def save_video_for_user(user_id: int, filename: str, query: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("INSERT INTO videos (user_id, filename, query) VALUES (?, ?, ?)", (user_id, filename, query))
+async def get_user_by_username(username: str):
+    return await db.fetchone_async("SELECT * FROM users WHERE username = ?", (username,))
 
-def get_videos_by_user(user_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
-        return conn.execute("SELECT id, filename, query FROM videos WHERE user_id = ?", (user_id,)).fetchall()
+async def current_user(username: Optional[str]):
+    """The user behind the ``username`` cookie, cached for AUTH_CACHE_SECONDS."""
+    if not username:
+        return None
+    user = auth_cache.get(username)
+    if user is None:
+        user = await get_user_by_username(username)
+        if user:
+            auth_cache.set(username, user)
+    return user
+
+def user_share_weight(user_id: int) -> float:
+    """Fair-share weight of a user for the job scheduler, cached like the login lookups."""
+    weight = share_weights.get(user_id)
+    if weight is None:
+        row = db.fetchone("SELECT share_weight FROM users WHERE id = ?", (user_id,))
+        weight = row[0] if row and row[0] else 1.
+        share_weights.set(user_id, weight)
+    return weight
+
+def save_video_for_user(user_id: int, filename: str, query: str, poster: Optional[str] = None, duration: Optional[float] = None):
+    db.execute("INSERT INTO videos (user_id, filename, query, poster, duration) VALUES (?, ?, ?, ?, ?)",
+               (user_id, filename, query, poster, duration))
+
+async def get_videos_by_user(user_id: int, before: Optional[int] = None, limit: int = VIDEOS_PER_PAGE):
+    """Newest first, one page at a time: the videos older than id ``before``."""
+    return await db.fetchall_async("""
+        SELECT id, filename, query, poster, duration FROM videos
+        WHERE user_id = ? AND id < ?
+        ORDER BY id DESC LIMIT ?
+    """, (user_id, before if before is not None else 2 ** 63 - 1, limit))
+
+def describe_video(full_path):
+    """Poster frame (path relative to UPLOAD_FOLDER) and duration of a finished video, made once per video."""
+    poster_path = os.path.splitext(full_path)[0] + ".jpg"
+    poster = os.path.relpath(poster_path, UPLOAD_FOLDER).replace("\\", "/") if save_poster(full_path, poster_path) else None
+    return poster, probe_duration(full_path)
 
 def delete_video_for_user(user_id: int, video_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
-        video = conn.execute("SELECT filename FROM videos WHERE id = ? AND user_id = ?", (video_id, user_id)).fetchone()
+    with db.connection() as conn:
+        video = conn.execute("SELECT filename, poster FROM videos WHERE id = ? AND user_id = ?", (video_id, user_id)).fetchone()
         if video:
-            filename = video[0]
-            full_path = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.exists(full_path):
-                os.remove(full_path)
+            # The rest of the job directory is reclaimed by the storage collector.
+            for path in video_paths(UPLOAD_FOLDER, *video):
+                remove_path(path)
             conn.execute("DELETE FROM videos WHERE id = ? AND user_id = ?", (video_id, user_id))
 
+def publish_hls(rendered_path, full_path):
+    """Playlist URL for ``full_path``, reusing the renditions made next to ``rendered_path`` if there are any."""
+    hls_dir = hls_dir_for(full_path)
+    if not os.path.isdir(hls_dir):
+        if os.path.isdir(hls_dir_for(rendered_path)):
+            link_tree(hls_dir_for(rendered_path), hls_dir)
+        elif not package_hls(full_path, hls_dir):
+            return None
+    return "/uploads/" + os.path.relpath(os.path.join(hls_dir, "master.m3u8"), UPLOAD_FOLDER).replace("\\", "/")
+
+def record_finished_video(job, full_path):
+    if not full_path or not os.path.exists(full_path):
+        raise RuntimeError("inference produced no video")
+    rendered_path = full_path
+    if os.path.dirname(os.path.abspath(full_path)) != os.path.abspath(job["result_dir"]):
+        # Coalesced jobs get their own link, so deleting one user's video keeps the others'.
+        own_path = os.path.join(job["result_dir"], os.path.basename(full_path))
+        link_or_copy(full_path, own_path)
+        full_path = own_path
+    rel_url = os.path.relpath(full_path, UPLOAD_FOLDER).replace("\\", "/")
+    save_video_for_user(job["user_id"], rel_url, job["query"], *describe_video(full_path))
+    key = None
+    if job["result_key"]:
+        # A degraded render is only a hit for requests asking for what was actually rendered.
+        key = job["result_key"] if not job["degraded"] else result_key(
+            job["image_sha"], job["pdf_sha"], job["audio_sha"], job["query"],
+            job["enhancer"], job["size"], job["preprocess"], job["background_enhancer"])
+        result_cache.store(key, full_path)
+    playlist_url = publish_hls(rendered_path, full_path) if job["hls"] else None
+    if key and playlist_url:
+        result_cache.store_hls(key, hls_dir_for(full_path))
+    return {"url": f"/uploads/{rel_url}", "playlist_url": playlist_url}
+
+def serve_cached_result(job_id, user_id, query, cached_path, hls=False):
+    """Link a cached video into the job's directory; returns (result columns, video path).
+
+    The playlist is only included if the cache already holds its renditions,
+    the transcode is left to package_cached_hls so a cache hit answers at once.
+    """
+    full_path = os.path.join(UPLOAD_FOLDER, "jobs", job_id, os.path.basename(cached_path))
+    link_or_copy(cached_path, full_path)
+    rel_url = os.path.relpath(full_path, UPLOAD_FOLDER).replace("\\", "/")
+    save_video_for_user(user_id, rel_url, query, *describe_video(full_path))
+    has_hls = hls and os.path.isdir(hls_dir_for(cached_path))
+    return {
+        "url": f"/uploads/{rel_url}",
+        "playlist_url": publish_hls(cached_path, full_path) if has_hls else None,
+    }, full_path
+
+def package_cached_hls(job_id, key, full_path):
+    """Transcode the ladder of a video served from the cache and keep it there for the next hit."""
+    playlist_url = publish_hls(full_path, full_path)
+    if playlist_url:
+        update_job(db, job_id, playlist_url=playlist_url)
+        result_cache.store_hls(key, hls_dir_for(full_path))
+
+def release_blobs(blobs):
+    for blob in blobs:
+        if blob:
+            blob_store.release(blob.sha256)
+
+# --------- Job Scheduling ---------
+def job_payload(job):
+    return {
+        "status": job["state"],
+        "url": job["url"],
+        "playlist_url": job["playlist_url"],
+        "degraded": job["degraded"].split(",") if job["degraded"] else [],
+        "error": job["error"],
+        "stage": job["stage"],
+        "percent": job["progress"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+def load_job_record(job_id):
+    """Persisted payload of a job and the id whose live progress applies to it (reads the database only)."""
+    job = get_job(db, job_id)
+    if not job:
+        return None, None
+    payload = job_payload(job)
+    # A coalesced job reports the progress of the job doing the work until it is settled.
+    if job["coalesced_into"] and job["state"] not in TERMINAL_STATES:
+        leader = get_job(db, job["coalesced_into"])
+        if leader and leader["state"] not in TERMINAL_STATES:
+            payload.update(status=leader["state"], stage=leader["stage"], percent=leader["progress"], started_at=leader["started_at"])
+            return payload, leader["id"]
+    return payload, job_id
+
+def load_job_payload(job_id):
+    payload, progress_id = load_job_record(job_id)
+    if payload:
+        payload.update(progress_hub.current(progress_id))
+    return payload
+
+def handle_job_progress(job_id, event):
+    progress_hub.publish(job_id, event)
+    stage_timer.observe_event(job_id, event)
+    # Only stage transitions are persisted, the fine-grained percent stays in memory.
+    if event["type"] == "stage" and event["state"] == "start":
+        update_job(db, job_id, stage=event["stage"], progress=overall_percent(event["stage"], 0.))
+
+def handle_job_state(job_id, event):
+    progress_hub.publish(job_id, event)
+    if event["status"] in TERMINAL_STATES:
+        jobs_finished.inc(state=event["status"])
+        stage_timer.forget(job_id)
+
+@contextmanager
+def job_stage(job_id, name):
+    handle_job_progress(job_id, {"type": "stage", "stage": name, "state": "start", "time": time.time()})
+    try:
+        yield
+    finally:
+        handle_job_progress(job_id, {"type": "stage", "stage": name, "state": "end", "time": time.time()})
+
+batch_locks = weakref.WeakValueDictionary()  # batch_id -> lock, alive while a job of the batch uses it
+batch_locks_guard = threading.Lock()
+
+def answer_batch_job(job):
+    """Answer of a batch job, fetched together with the next unanswered queries of its batch."""
+    with batch_locks_guard:
+        lock = batch_locks.setdefault(job["batch_id"], threading.Lock())
+    with lock:
+        row = db.fetchone("SELECT answer FROM jobs WHERE id = ?", (job["id"],))
+        if row and row[0]:
+            return row[0]
+        siblings = db.fetchall("""
+            SELECT id, query FROM jobs
+            WHERE batch_id = ? AND answer IS NULL AND coalesced_into IS NULL AND state IN ('queued', 'preparing')
+            ORDER BY id = ? DESC, created_at LIMIT ?
+        """, (job["batch_id"], job["id"], RAG_BATCH_SIZE))
+        answers = get_rag_answers(job["pdf_path"], [query for _, query in siblings], doc_id=job["pdf_sha"])
+        with db.connection() as conn:
+            for (sibling_id, _), answer in zip(siblings, answers):
+                if answer:
+                    conn.execute("UPDATE jobs SET answer = ? WHERE id = ? AND answer IS NULL", (answer, sibling_id))
+        return dict(zip([sibling_id for sibling_id, _ in siblings], answers)).get(job["id"])
+
+def prepare_job_audio(job):
+    """RAG answer and its speech for a job, run by the scheduler before the render is queued."""
+    with job_stage(job["id"], "rag"):
+        if job["answer"]:
+            # Fetched with another job of its batch, or before a restart.
+            answer = job["answer"]
+        elif job["batch_id"]:
+            answer = answer_batch_job(job)
+        else:
+            answer = get_rag_answer(job["pdf_path"], job["query"], doc_id=job["pdf_sha"])
+    if not answer:
+        raise RuntimeError("No answer from RAG")
+    print(f"[{job['id']}] ✅ RAG Answer:", answer)
+    # A cancel cannot interrupt a service call, but it spares the TTS call that would follow.
+    if db.fetchone("SELECT state FROM jobs WHERE id = ?", (job["id"],))[0] == "cancelled":
+        raise JobCancelled(job["id"])
+    timings = {}
+    with job_stage(job["id"], "tts"):
+        driven_audio = synthesize_tts_audio(answer, "en", "en", job["audio_path"], output_dir=job["result_dir"], timings=timings)
+    for name, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=name)
+    if not driven_audio:
+        raise RuntimeError("TTS audio generation failed")
+    return {"answer": answer, "driven_audio": driven_audio, "audio_seconds": audio_duration(driven_audio)}
+
+metrics_registry = Registry()
+stage_seconds = metrics_registry.histogram("hmi_stage_duration_seconds", "Wall-clock time of a pipeline stage", ["stage"])
+jobs_finished = metrics_registry.counter("hmi_jobs_finished_total", "Jobs that reached a final state", ["state"])
+jobs_rejected = metrics_registry.counter("hmi_jobs_rejected_total", "Jobs turned away because the expected wait was too long", ["priority"])
+metrics_registry.gauge("hmi_jobs", "Unfinished jobs by state", ["state"],
+                       collect=lambda: {(state,): count for state, count in count_jobs_by_state(db).items()})
+metrics_registry.gauge("hmi_workers_busy", "Render workers currently running a job",
+                       collect=lambda: {(): worker_pool.busy_workers()})
+metrics_registry.gauge("hmi_workers", "Render workers in the pool",
+                       collect=lambda: {(): len(RENDER_DEVICES) * WORKERS_PER_DEVICE})
+stage_timer = StageTimer(stage_seconds)
+
+progress_hub = ProgressHub()
+worker_pool = InferenceWorkerPool(RENDER_DEVICES, WORKERS_PER_DEVICE, on_progress=handle_job_progress)
+scheduler = JobScheduler(db, worker_pool, prepare_job_audio, record_finished_video, max_per_device=WORKERS_PER_DEVICE,
+                         on_state=handle_job_state, batch_slots=BATCH_SLOTS_PER_DEVICE,
+                         prep_workers=PREP_WORKERS, aging_rate=RENDER_AGING_RATE,
+                         policy=DegradePolicy(DEGRADE_QUEUE_DEPTHS, DEGRADE_ETA_SECONDS),
+                         estimator=ThroughputEstimator(), weight=user_share_weight,
+                         render_options={"avatar_cache_dir": AVATAR_CACHE_DIR})
+
+# username -> time of their last page load, to tell a closed tab from a navigation or reload.
+page_views = {}
+
+def cancel_if_abandoned(job_id, username, hidden_at):
+    # The page request of a same-tab navigation can reach us just before the beacon does.
+    if page_views.get(username, 0) >= hidden_at - 5:
+        return
+    print(f"[{job_id}] 👋 Tab closed")
+    asyncio.get_running_loop().run_in_executor(None, scheduler.cancel, job_id)
+
+@app.on_event("startup")
+async def start_worker_pool():
+    progress_hub.bind(asyncio.get_running_loop())
+    worker_pool.start()
+    scheduler.start()
+    storage_collector.start()
+
+@app.on_event("shutdown")
+def stop_worker_pool():
+    storage_collector.stop()
+    scheduler.stop()
+    hls_executor.shutdown(wait=False)
+    worker_pool.shutdown()
+
 # --------- Routes ---------
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.api_route("/uploads/{path:path}", methods=["GET", "HEAD"])
+async def serve_upload(request: Request, path: str):
+    root = os.path.realpath(UPLOAD_FOLDER)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root or not os.path.isfile(full_path):
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    return file_response(request, full_path)
+
 @app.get("/register.html", response_class=HTMLResponse)
 async def show_register(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
@@ -85,16 +403,19 @@ async def show_login(request: Request):
 async def rag_ui(request: Request, username: Optional[str] = Cookie(None)):
     if not username:
         return RedirectResponse("/login.html", status_code=303)
+    page_views[username] = time.time()
     return templates.TemplateResponse("rag.html", {"request": request, "username": username})
 
 @app.get("/profile.html", response_class=HTMLResponse)
-async def profile(request: Request, username: Optional[str] = Cookie(None)):
-    if not username:
-        return RedirectResponse("/login.html", status_code=303)
-    user = get_user_by_username(username)
+async def profile(request: Request, before: Optional[int] = None, username: Optional[str] = Cookie(None)):
+    user = await current_user(username)
     if not user:
         return RedirectResponse("/login.html", status_code=303)
-    videos = get_videos_by_user(user[0])
+    page_views[username] = time.time()
+    # One extra row tells whether there is an older page.
+    videos = await get_videos_by_user(user[0], before, VIDEOS_PER_PAGE + 1)
+    older = videos[VIDEOS_PER_PAGE - 1][0] if len(videos) > VIDEOS_PER_PAGE else None
+    videos = videos[:VIDEOS_PER_PAGE]
     return templates.TemplateResponse("profile.html", {
         "request": request,
         "user": {
@@ -102,34 +423,32 @@ async def profile(request: Request, username: Optional[str] = Cookie(None)):
             "last_name": user[2],
             "username": user[3]
         },
-        "videos": [{"id": v[0], "url": f"/uploads/{v[1]}", "query": v[2]} for v in videos]
+        "videos": [{
+            "id": v[0],
+            "url": f"/uploads/{v[1]}",
+            "query": v[2],
+            "poster": f"/uploads/{v[3]}" if v[3] else None,
+            "duration": f"{int(v[4]) // 60}:{int(v[4]) % 60:02d}" if v[4] else None,
+        } for v in videos],
+        "older": older,
+        "first_page": before is None,
     })
 
 from fastapi import Form
 
 @app.post("/delete-video")
 async def delete_video(video_id: int = Form(...), username: Optional[str] = Cookie(None)):
-    if not username:
-        return RedirectResponse("/login.html", status_code=303)
-
-    user = get_user_by_username(username)
+    user = await current_user(username)
     if not user:
         return RedirectResponse("/login.html", status_code=303)
 
-    # Get video filename by ID (with user verification)
-    with sqlite3.connect(DB_PATH) as conn:
-        video = conn.execute("SELECT filename FROM videos WHERE id = ? AND user_id = ?", (video_id, user[0])).fetchone()
-        if video:
-            file_path = os.path.join(UPLOAD_FOLDER, video[0])
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            conn.execute("DELETE FROM videos WHERE id = ?", (video_id,))
-    
+    await run_in_threadpool(delete_video_for_user, user[0], video_id)
     return RedirectResponse("/profile.html", status_code=303)
 
 
 @app.post("/logout")
-async def logout(response: Response):
+async def logout(response: Response, username: Optional[str] = Cookie(None)):
+    auth_cache.discard(username)
     response = RedirectResponse("/", status_code=302)
     response.delete_cookie("username")
     return response
@@ -138,102 +457,279 @@ async def logout(response: Response):
 async def register_user(first_name: str = Form(...), last_name: str = Form(...), username: str = Form(...), password: str = Form(...), confirm_password: str = Form(...)):
     if password != confirm_password:
         return RedirectResponse("/register.html?error=PasswordMismatch", status_code=303)
-    if get_user_by_username(username):
+    if await get_user_by_username(username):
         return RedirectResponse("/register.html?error=UsernameTaken", status_code=303)
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("INSERT INTO users (first_name, last_name, username, password) VALUES (?, ?, ?, ?)",
-                     (first_name, last_name, username, hash_password(password)))
+    await db.execute_async("INSERT INTO users (first_name, last_name, username, password) VALUES (?, ?, ?, ?)",
+                           (first_name, last_name, username, hash_password(password)))
     return RedirectResponse("/login.html?success=AccountCreated", status_code=302)
 
 @app.post("/login")
 async def login_user(response: Response, username: str = Form(...), password: str = Form(...)):
-    user = get_user_by_username(username)
+    user = await get_user_by_username(username)
     if not user or user[4] != hash_password(password):
         return RedirectResponse("/login.html?error=InvalidCredentials", status_code=303)
     response = RedirectResponse("/rag.html", status_code=302)
     response.set_cookie("username", username)
     return response
 
+def validate_render_options(size, preprocess, background_enhancer, priority):
+    """Error response for unsupported render options, or None."""
+    if size not in SIZES or preprocess not in PREPROCESS_MODES or background_enhancer not in BACKGROUND_ENHANCERS:
+        return JSONResponse(status_code=400, content={"error": "Unsupported size, preprocess mode or background enhancer"})
+    if priority not in PRIORITIES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown priority: {priority}"})
+    return None
+
+async def store_inputs(source_image, rag_document, reference_audio):
+    """(image, pdf, audio) blobs of a request; UploadTooLarge after releasing what was stored."""
+    stored = []
+    try:
+        for upload, max_bytes in ((source_image, MAX_IMAGE_BYTES), (rag_document, MAX_DOCUMENT_BYTES), (reference_audio, MAX_AUDIO_BYTES)):
+            stored.append(await blob_store.put(upload, max_bytes) if upload else None)
+    except UploadTooLarge:
+        release_blobs(stored)
+        raise
+    return stored
+
+def job_fields_for(job_id, query, image, pdf, audio, enhancer, background_enhancer, size, preprocess, priority, hls, batch_id=None):
+    return dict(
+        query=query,
+        image_path=image.path, image_sha=image.sha256,
+        pdf_path=pdf.path, pdf_sha=pdf.sha256,
+        audio_path=audio.path if audio else None, audio_sha=audio.sha256 if audio else None,
+        enhancer=enhancer, background_enhancer=background_enhancer, size=size, preprocess=preprocess,
+        priority=PRIORITIES[priority],
+        hls=int(hls),
+        result_key=result_key(image.sha256, pdf.sha256, audio.sha256 if audio else None, query, enhancer, size, preprocess, background_enhancer),
+        result_dir=os.path.join(UPLOAD_FOLDER, "jobs", job_id),
+        batch_id=batch_id,
+    )
+
+async def serve_from_cache(job_id, user_id, job_fields):
+    """Complete the job right away from the result cache; returns its response, or None on a miss."""
+    cached_path = await run_in_threadpool(result_cache.lookup, job_fields["result_key"])
+    if not cached_path:
+        return None
+    result, full_path = await run_in_threadpool(serve_cached_result, job_id, user_id, job_fields["query"], cached_path, job_fields["hls"])
+    now = time.time()
+    await run_in_threadpool(create_job, db, job_id, user_id, state="completed", progress=100., started_at=now, finished_at=now, **result, **job_fields)
+    if job_fields["hls"] and not result["playlist_url"]:
+        # The MP4 is playable right away, the playlist is added to the job once transcoded.
+        hls_executor.submit(package_cached_hls, job_id, job_fields["result_key"], full_path)
+    print(f"[{job_id}] ♻️ Served from result cache")
+    jobs_finished.inc(state="cached")
+    return {"job_id": job_id, "cached": True}
+
+async def enqueue_job(job_id, user_id, job_fields):
+    leader_id = await run_in_threadpool(create_or_attach_job, db, job_id, user_id, **job_fields)
+    if leader_id:
+        print(f"[{job_id}] 🔗 Attached to in-flight job {leader_id}")
+        return {"job_id": job_id, "coalesced_into": leader_id}
+    return {"job_id": job_id}
+
+def over_admission_limit(eta):
+    return bool(ADMISSION_MAX_ETA_SECONDS) and eta > ADMISSION_MAX_ETA_SECONDS
+
+def reject_busy(stored, eta, priority):
+    release_blobs(stored)
+    jobs_rejected.inc(priority=priority)
+    retry_after = math.ceil(eta - ADMISSION_MAX_ETA_SECONDS)
+    print(f"⛔ Rejected a {priority} request, expected to take {eta:.0f}s")
+    return JSONResponse(status_code=429, headers={"Retry-After": str(retry_after)}, content={
+        "error": "The server is busy, please try again later",
+        "eta_seconds": round(eta),
+        "retry_after": retry_after,
+    })
+
 @app.post("/generate")
-async def generate_video(background_tasks: BackgroundTasks, request: Request, source_image: UploadFile = File(...), rag_document: UploadFile = File(...), rag_query: str = Form(...), enhancer: str = Form(""), reference_audio: UploadFile = File(None), username: Optional[str] = Cookie(None)):
+async def generate_video(request: Request, source_image: UploadFile = File(...), rag_document: UploadFile = File(...), rag_query: str = Form(...), enhancer: str = Form(""), background_enhancer: str = Form(""), size: int = Form(256), preprocess: str = Form("crop"), priority: str = Form("interactive"), hls: bool = Form(False), reference_audio: UploadFile = File(None), username: Optional[str] = Cookie(None)):
     if not username:
         return JSONResponse(status_code=403, content={"error": "Not logged in"})
-    user = get_user_by_username(username)
+    user = await current_user(username)
     if not user:
         return JSONResponse(status_code=403, content={"error": "User not found"})
+    invalid = validate_render_options(size, preprocess, background_enhancer, priority)
+    if invalid:
+        return invalid
     job_id = str(uuid.uuid4())
-    video_status[job_id] = {"status": "pending", "url": None}
-
-    temp_dir = os.path.join(UPLOAD_FOLDER, str(uuid.uuid4()))
-    os.makedirs(temp_dir, exist_ok=True)
-
-    def save_file(upload: UploadFile, name: str):
-        ext = os.path.splitext(upload.filename)[1]
-        path = os.path.join(temp_dir, name + ext)
-        with open(path, "wb") as f:
-            f.write(upload.file.read())
-        return path
-
-    image_path = save_file(source_image, "image")
-    pdf_path = save_file(rag_document, "doc")
-    audio_path = save_file(reference_audio, "audio") if reference_audio else None
-
-    background_tasks.add_task(
-        process_video_job,
-        job_id,
-        user[0],
-        image_path,
-        pdf_path,
-        rag_query,
-        enhancer,
-        audio_path
-    )
-    return {"job_id": job_id}
 
-def process_video_job(job_id, user_id, image_path, pdf_path, rag_query, enhancer, audio_path):
     try:
-        temp_dir = os.path.dirname(image_path)
-        args = [
-            r"D:\\avatar_speech\\sadenv\\Scripts\\python.exe", "inference3.py",
-            "--source_image", image_path,
-            "--rag_query", rag_query,
-            "--rag_document", pdf_path,
-            "--source_lang", "en", "--target_lang", "en",
-            "--result_dir", temp_dir
-        ]
-        if audio_path:
-            args += ["--reference_audio", audio_path]
-        if enhancer:
-            args += ["--enhancer", enhancer]
-
-        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-        while True:
-            output = process.stdout.readline()
-            if output == "" and process.poll() is not None:
-                break
-            if output:
-                print(f"[{job_id}] 🔧", output.strip())
-
-        if process.poll() != 0:
-            video_status[job_id] = {"status": "error", "url": None}
-            return
-
-        video_file = next((f for f in os.listdir(temp_dir) if f.endswith(".mp4")), None)
-        if not video_file:
-            video_status[job_id] = {"status": "error", "url": None}
-            return
-
-        full_path = os.path.join(temp_dir, video_file)
-        rel_url = os.path.relpath(full_path, UPLOAD_FOLDER).replace("\\", "/")
-        save_video_for_user(user_id, rel_url, rag_query)
-        video_status[job_id] = {"status": "completed", "url": f"/uploads/{rel_url}"}
+        stored = await store_inputs(source_image, rag_document, reference_audio)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    job_fields = job_fields_for(job_id, rag_query, *stored, enhancer, background_enhancer, size, preprocess, priority, hls)
+
+    cached = await serve_from_cache(job_id, user[0], job_fields)
+    if cached:
+        return cached
+
+    # A job that would be coalesced adds no work, so only new work is subject to admission control.
+    eta = await run_in_threadpool(scheduler.estimate_seconds)
+    if over_admission_limit(eta) and not await run_in_threadpool(find_in_flight_job, db, job_fields["result_key"]):
+        return reject_busy(stored, eta, priority)
+
+    response = await enqueue_job(job_id, user[0], job_fields)
+    scheduler.notify()
+    if "coalesced_into" not in response:
+        response["eta_seconds"] = round(eta)
+    return response
+
+@app.post("/generate-batch")
+async def generate_batch(request: Request, source_image: UploadFile = File(...), rag_document: UploadFile = File(...), rag_queries: List[str] = Form(...), enhancer: str = Form(""), background_enhancer: str = Form(""), size: int = Form(256), preprocess: str = Form("crop"), priority: str = Form("batch"), hls: bool = Form(False), reference_audio: UploadFile = File(None), username: Optional[str] = Cookie(None)):
+    """One document and one avatar, many queries (repeated ``rag_queries`` fields or one per line).
 
+    The inputs are stored once and every query becomes a job of the same batch:
+    the document is ingested once per RAG_BATCH_SIZE answers and the avatar's
+    3DMM extraction is reused from the avatar cache, while the TTS and render
+    stages of the answers run in parallel like any other jobs.
+    """
+    if not username:
+        return JSONResponse(status_code=403, content={"error": "Not logged in"})
+    user = await current_user(username)
+    if not user:
+        return JSONResponse(status_code=403, content={"error": "User not found"})
+    invalid = validate_render_options(size, preprocess, background_enhancer, priority)
+    if invalid:
+        return invalid
+    queries = [line.strip() for query in rag_queries for line in query.splitlines() if line.strip()]
+    if not queries or len(queries) > MAX_BATCH_QUERIES:
+        return JSONResponse(status_code=400, content={"error": f"A batch takes between 1 and {MAX_BATCH_QUERIES} queries"})
+
+    try:
+        stored = await store_inputs(source_image, rag_document, reference_audio)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    eta = await run_in_threadpool(scheduler.estimate_seconds, len(queries))
+    if over_admission_limit(eta):
+        return reject_busy(stored, eta, priority)
+    # Every job holds its own reference to the inputs.
+    for blob in stored:
+        if blob and len(queries) > 1:
+            await run_in_threadpool(blob_store.retain, blob.sha256, len(queries) - 1)
+
+    batch_id = str(uuid.uuid4())
+    jobs = []
+    try:
+        for query in queries:
+            job_id = str(uuid.uuid4())
+            job_fields = job_fields_for(job_id, query, *stored, enhancer, background_enhancer, size, preprocess, priority, hls, batch_id)
+            jobs.append(await serve_from_cache(job_id, user[0], job_fields) or await enqueue_job(job_id, user[0], job_fields))
+    except Exception:
+        # The jobs that were never created hand their references back.
+        for _ in range(len(queries) - len(jobs)):
+            await run_in_threadpool(release_blobs, stored)
+        raise
+    scheduler.notify()
+    print(f"📦 Batch {batch_id}: {len(jobs)} queries")
+    return {
+        "batch_id": batch_id,
+        "jobs": jobs,
+        "eta_seconds": round(eta),
+    }
+
+def start_document_ingestion(path):
+    try:
+        return register_document(path, wait=False)
+    finally:
+        os.remove(path)
+
+@app.post("/documents")
+async def upload_document(rag_document: UploadFile = File(...), username: Optional[str] = Cookie(None)):
+    """Hand a PDF to the RAG service as soon as it is picked, so it is indexed before the question is asked.
+
+    The PDF is still sent with /generate: the job finds the index ready under the same id.
+    """
+    if not await current_user(username):
+        return JSONResponse(status_code=403, content={"error": "Not logged in"})
+    try:
+        stored = await save_upload(rag_document, blob_store.tmp_dir, uuid.uuid4().hex, MAX_DOCUMENT_BYTES)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    try:
+        document_id = await run_in_threadpool(start_document_ingestion, stored.path)
+    except Exception as e:
+        print("❌ Document registration failed:", e)
+        return JSONResponse(status_code=502, content={"error": "The document service is not available"})
+    return {"document_id": document_id, "status": "indexing"}
+
+@app.get("/documents/{document_id}")
+async def get_document_status(document_id: str, username: Optional[str] = Cookie(None)):
+    if not await current_user(username):
+        return JSONResponse(status_code=403, content={"error": "Not logged in"})
+    try:
+        return await run_in_threadpool(document_status, document_id)
     except Exception as e:
-        print(f"[{job_id}] ❌ Error:", e)
-        video_status[job_id] = {"status": "error", "url": None}
+        print("❌ Document status failed:", e)
+        return JSONResponse(status_code=502, content={"error": "The document service is not available"})
+
+@app.post("/cancel/{job_id}")
+async def cancel_job(job_id: str, username: Optional[str] = Cookie(None)):
+    if not username:
+        return JSONResponse(status_code=403, content={"error": "Not logged in"})
+    user = await current_user(username)
+    job = await run_in_threadpool(get_job, db, job_id)
+    if not user or not job or job["user_id"] != user[0]:
+        return JSONResponse(status_code=404, content={"error": "Unknown job"})
+    if not await run_in_threadpool(scheduler.cancel, job_id):
+        job = await run_in_threadpool(get_job, db, job_id)
+        return JSONResponse(status_code=409, content={"error": f"Job already {job['state']}"})
+    return {"job_id": job_id, "status": "cancelled"}
+
+@app.post("/abandon/{job_id}")
+async def abandon_job(job_id: str, username: Optional[str] = Cookie(None)):
+    """Beacon of a tab hidden while the job was in flight.
+
+    pagehide also fires when the user follows a link to their profile or reloads,
+    so the job is only cancelled if no page is opened within ABANDON_GRACE_SECONDS.
+    """
+    user = await current_user(username)
+    job = await run_in_threadpool(get_job, db, job_id)
+    if not user or not job or job["user_id"] != user[0]:
+        return JSONResponse(status_code=404, content={"error": "Unknown job"})
+    asyncio.get_running_loop().call_later(ABANDON_GRACE_SECONDS, cancel_if_abandoned, job_id, username, time.time())
+    return {"job_id": job_id, "cancel_in_seconds": ABANDON_GRACE_SECONDS}
 
 @app.get("/status/{job_id}")
 async def check_status(job_id: str):
-    if job_id not in video_status:
+    payload, progress_id = await run_in_threadpool(load_job_record, job_id)
+    if not payload:
         return {"status": "unknown"}
-    return video_status[job_id]
\ No newline at end of file
+    payload.update(progress_hub.current(progress_id))
+    return payload
+
+@app.get("/events/{job_id}")
+async def job_events(request: Request, job_id: str):
+    job = await run_in_threadpool(get_job, db, job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={"error": "Unknown job"})
+
+    async def stream():
+        while True:
+            # Coalesced jobs follow the events of the job doing the work while it is in flight.
+            # Once that job ends, an attached job is either settled with it or detached from it
+            # (e.g. its leader was cancelled) and is followed again under whatever id now applies.
+            _, watched_id = await run_in_threadpool(load_job_record, job_id)
+            if watched_id is None:
+                return
+            snapshot = None
+            async for snapshot in progress_hub.subscribe(watched_id, lambda: load_job_payload(job_id)):
+                if await request.is_disconnected():
+                    return
+                if snapshot is None:
+                    if watched_id != job_id and (await run_in_threadpool(load_job_record, job_id))[1] != watched_id:
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if watched_id != job_id and snapshot["status"] in TERMINAL_STATES:
+                    snapshot, _ = await run_in_threadpool(load_job_record, job_id)
+                yield f"data: {json.dumps(snapshot)}\n\n"
+            if watched_id == job_id or (snapshot and snapshot["status"] in TERMINAL_STATES):
+                return
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics")
+async def metrics():
+    body = await run_in_threadpool(metrics_registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,188 @@
+"""On-disk cache of document indexes for rag.py.
+
+Parsing a PDF, splitting it and embedding every chunk is by far the most
+expensive part of a RAG query, and it only depends on the document.  Each
+document is therefore ingested once and kept under ``root/<key>/``, keyed by
+the SHA-256 of the PDF together with the embedding model and the splitter
+settings:
+
+* ``pages.json`` and ``chunks.json`` hold the parsed pages and the chunks;
+* ``flat/`` holds the chunk vectors as a FlatIndex (flat_index.py), or
+  ``chroma/`` a persisted Chroma collection with the ``chroma`` backend;
+* ``entry.json`` is written last and marks the entry as complete.
+
+A follow-up question on the same document goes straight to retrieval.  The
+few most recently used indexes also stay open in memory.  Entries are touched
+on every use and the least recently used ones are removed once the cache
+exceeds ``max_bytes``.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from flat_index import FlatIndex
+from pdf_ingest import PdfParser
+
+INDEX_VERSION = 1
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _dump_documents(docs, path):
+    with open(path, "w") as f:
+        json.dump([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs], f)
+
+
+def _load_documents(path):
+    with open(path) as f:
+        return [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in json.load(f)]
+
+
+class IndexStore:
+
+    def __init__(self, root, embeddings, model_name, max_bytes, memory_slots=4, chunk_size=512, chunk_overlap=50,
+                 backend="flat", ivf_min_chunks=20000, parse_workers=None):
+        self.root = root
+        self.backend = backend  # "flat" or "chroma"
+        self.ivf_min_chunks = ivf_min_chunks  # flat indexes with at least this many chunks are partitioned
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.memory_slots = memory_slots
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.parser = PdfParser(parse_workers, chunk_size, chunk_overlap)
+        self._open = OrderedDict()  # key -> FlatIndex or Chroma, most recently used last
+        self._lock = threading.Lock()
+        self._key_locks = weakref.WeakValueDictionary()  # key -> lock, alive while the key is loaded or built
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, pdf_sha256):
+        settings = f"{INDEX_VERSION}:{pdf_sha256}:{self.model_name}:{self.chunk_size}:{self.chunk_overlap}:{self.backend}"
+        return hashlib.sha256(settings.encode()).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key)
+
+    def has(self, pdf_sha256):
+        return os.path.isfile(os.path.join(self._entry(self.key(pdf_sha256)), "entry.json"))
+
+    def lookup(self, pdf_sha256):
+        """The vector store of an indexed document, or None if it is not (or no longer) cached."""
+        return self.get(pdf_sha256, None)
+
+    def get(self, pdf_sha256, pdf_path):
+        """The vector store for a document, ingesting ``pdf_path`` only if it is not cached yet."""
+        key = self.key(pdf_sha256)
+        entry = self._entry(key)
+        with self._lock:
+            vectordb = self._open.get(key)
+            if vectordb is not None:
+                self._open.move_to_end(key)
+                os.utime(entry)
+                return vectordb
+            # Different documents are loaded and built concurrently, the same one only once.
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                vectordb = self._open.get(key)
+            if vectordb is not None:
+                return vectordb
+            if os.path.isfile(os.path.join(entry, "entry.json")):
+                print(f"📚 Index cache hit for {pdf_sha256[:12]}")
+                vectordb = self._load(entry)
+                os.utime(entry)
+            elif pdf_path:
+                vectordb = self._build(entry, pdf_sha256, pdf_path)
+            else:
+                return None
+            with self._lock:
+                self._open[key] = vectordb
+                while len(self._open) > self.memory_slots:
+                    self._open.popitem(last=False)
+                if pdf_path:
+                    self._evict(keep=entry)
+            return vectordb
+
+    def _load(self, entry):
+        if self.backend == "flat":
+            return FlatIndex.load(os.path.join(entry, "flat"), _load_documents(os.path.join(entry, "chunks.json")), self.embeddings)
+        return Chroma(persist_directory=os.path.join(entry, "chroma"), embedding_function=self.embeddings)
+
+    def _build(self, entry, pdf_sha256, pdf_path):
+        # A directory without entry.json is a build that did not finish.
+        shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(entry)
+        started = time.time()
+        pages, chunks, vectors = [], [], []
+        vectordb = None
+        # Chunks are embedded batch by batch while the parser works on the following pages.
+        for batch_pages, batch_chunks in self.parser.iter_batches(pdf_path):
+            pages += batch_pages
+            chunks += batch_chunks
+            if not batch_chunks:
+                continue
+            if self.backend == "flat":
+                vectors += self.embeddings.embed_documents([chunk.page_content for chunk in batch_chunks])
+            else:
+                if vectordb is None:
+                    vectordb = Chroma(persist_directory=os.path.join(entry, "chroma"), embedding_function=self.embeddings)
+                vectordb.add_documents(batch_chunks)
+        if not chunks:
+            raise ValueError("No text could be extracted from the PDF")
+        _dump_documents(pages, os.path.join(entry, "pages.json"))
+        _dump_documents(chunks, os.path.join(entry, "chunks.json"))
+        if self.backend == "flat":
+            ivf_lists = int(4 * len(chunks) ** 0.5) if len(chunks) >= self.ivf_min_chunks else 0
+            FlatIndex.write(np.asarray(vectors, dtype=np.float32), os.path.join(entry, "flat"), ivf_lists=ivf_lists)
+            vectordb = FlatIndex.load(os.path.join(entry, "flat"), chunks, self.embeddings)
+        with open(os.path.join(entry, "entry.json"), "w") as f:
+            json.dump({
+                "pdf_sha256": pdf_sha256,
+                "model": self.model_name,
+                "chunk_size": self.chunk_size,
+                "chunk_overlap": self.chunk_overlap,
+                "backend": self.backend,
+                "pages": len(pages),
+                "chunks": len(chunks),
+                "created_at": time.time(),
+            }, f)
+        print(f"📚 Indexed {pdf_sha256[:12]}: {len(pages)} pages, {len(chunks)} chunks in {time.time() - started:.1f}s")
+        return vectordb
+
+    def _evict(self, keep):
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            # Entries without entry.json are still being built, unless they were left behind long ago.
+            if os.path.isdir(path) and (os.path.isfile(os.path.join(path, "entry.json")) or now - os.path.getmtime(path) > 86400):
+                entries.append((os.path.getmtime(path), _dir_size(path), name, path))
+        used = sum(size for _, size, _, _ in entries)
+        for _, size, name, path in sorted(entries):
+            if used <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._open.pop(name, None)
+            shutil.rmtree(path, ignore_errors=True)
+            used -= size
+            print(f"🧹 Evicted index {name[:12]} ({size // (1024 * 1024)} MB)")
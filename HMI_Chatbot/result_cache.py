@@ -0,0 +1,130 @@
+"""End-to-end result cache for /generate.
+
+A finished video is remembered under a key built from the content hashes of
+the avatar, the document and the reference voice, the normalised question and
+the render options.  When the same request comes in again the stored MP4 is
+linked into the new job directory instead of running RAG, XTTS, SadTalker and
+the enhancer again.  The HLS renditions of a cached video, once made, are kept
+next to it (``store_hls``) so later hits do not transcode it again.  Cached
+files are evicted least-recently-used once their total size exceeds
+``max_bytes``.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from media import hls_dir_for
+
+
+def result_key(image_sha, pdf_sha, audio_sha, query, enhancer, size, preprocess, background_enhancer=None):
+    normalised_query = " ".join(query.split()).lower()
+    parts = [image_sha, pdf_sha, audio_sha, normalised_query, enhancer or "", int(size), preprocess]
+    if background_enhancer:
+        # Only appended when set, so keys of earlier entries stay valid.
+        parts.append(background_enhancer)
+    payload = json.dumps(parts)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hard-link ``src`` to ``dst`` so a cached video costs no extra disk, copy across filesystems."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def link_tree(src_dir, dst_dir):
+    """link_or_copy every file below ``src_dir`` to the same place below ``dst_dir``."""
+    for root, _, files in os.walk(src_dir):
+        for name in files:
+            src = os.path.join(root, name)
+            link_or_copy(src, os.path.join(dst_dir, os.path.relpath(src, src_dir)))
+
+
+def _tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def init_result_cache_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS result_cache (
+            key TEXT PRIMARY KEY,
+            path TEXT,
+            size INTEGER,
+            created_at REAL,
+            last_used_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_lru ON result_cache(last_used_at)")
+
+
+class ResultCache:
+
+    def __init__(self, root, db, max_bytes):
+        self.root = root
+        self.db = db
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def lookup(self, key):
+        """Return the cached video path for ``key`` or None, refreshing its LRU position."""
+        with self.db.connection() as conn:
+            row = conn.execute("SELECT path FROM result_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]):
+                conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE result_cache SET last_used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def store(self, key, video_path):
+        path = os.path.join(self.root, key + os.path.splitext(video_path)[1])
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(path)
+            shutil.rmtree(hls_dir_for(path), ignore_errors=True)
+            link_or_copy(video_path, path)
+            now = time.time()
+            with self.db.connection() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO result_cache (key, path, size, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, path, os.path.getsize(path), now, now))
+            self._evict()
+
+    def store_hls(self, key, hls_dir):
+        """Keep the renditions in ``hls_dir`` with the cached video of ``key``, if it is still cached."""
+        with self._lock:
+            with self.db.connection() as conn:
+                row = conn.execute("SELECT path FROM result_cache WHERE key = ?", (key,)).fetchone()
+                if row is None or os.path.isdir(hls_dir_for(row[0])):
+                    return
+                # Linked under a temporary name first, so a concurrent hit never sees half a ladder.
+                tmp = os.path.join(self.root, "tmp-" + uuid.uuid4().hex)
+                link_tree(hls_dir, tmp)
+                os.rename(tmp, hls_dir_for(row[0]))
+                conn.execute("UPDATE result_cache SET size = size + ? WHERE key = ?", (_tree_size(hls_dir), key))
+            self._evict()
+
+    def _evict(self):
+        with self.db.connection() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM result_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, path, size in conn.execute("SELECT key, path, size FROM result_cache ORDER BY last_used_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if os.path.exists(path):
+                    os.remove(path)
+                shutil.rmtree(hls_dir_for(path), ignore_errors=True)
+                conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                total -= size
+                print(f"🧹 Evicted cached result {key[:12]} ({size} bytes)")
@@ -0,0 +1,200 @@
+"""Background garbage collection for uploads/.
+
+Everything on disk is reclaimed from what the database says is still needed:
+
+* a job directory (``uploads/jobs/<id>``, or ``uploads/<uuid>`` from before
+  the job queue) lives as long as a ``videos`` row points into it or a job
+  that has not finished uses it; otherwise it is removed.  In a directory
+  that is kept, everything except the videos, their posters and HLS
+  renditions is removed (speech audio, ``--verbose`` intermediates);
+* half-written uploads in the blob store's temp directory are expired;
+* avatar cache entries (src/utils/avatar_cache.py) not used for
+  ``job_retention`` seconds are removed;
+* job rows that finished more than ``job_retention`` seconds ago are deleted
+  and give back their references on the uploaded inputs (BlobStore.release);
+* a user's videos beyond ``user_quota_bytes`` are deleted, oldest first.
+
+Directories younger than ``grace`` are never touched, so a job that is just
+being created cannot lose its files.
+"""
+import os
+import shutil
+import threading
+import time
+import traceback
+
+from jobs import IN_FLIGHT_STATES
+from media import hls_dir_for
+
+RESERVED_DIRS = ("jobs", "blobs", "cache", "avatars")
+
+
+def video_paths(upload_folder, filename, poster):
+    """Everything on disk that belongs to one ``videos`` row."""
+    video = os.path.join(upload_folder, filename)
+    paths = [video, hls_dir_for(video)]
+    if poster:
+        paths.append(os.path.join(upload_folder, poster))
+    return paths
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def disk_usage(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class StorageCollector:
+
+    def __init__(self, db, upload_folder, blob_store, job_retention=30 * 86400, temp_max_age=6 * 3600,
+                 user_quota_bytes=0, grace=3600, interval=3600, avatar_cache_dir=None):
+        self.db = db
+        self.upload_folder = upload_folder
+        self.blob_store = blob_store
+        self.job_retention = job_retention
+        self.temp_max_age = temp_max_age
+        self.user_quota_bytes = user_quota_bytes  # 0 disables the quota
+        self.grace = grace
+        self.interval = interval
+        self.avatar_cache_dir = avatar_cache_dir
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.collect()
+            except Exception:
+                traceback.print_exc()
+
+    def collect(self):
+        stats = {
+            "expired_jobs": self._expire_jobs(),
+            "quota_videos": self._enforce_quotas(),
+            "job_dirs": self._collect_job_dirs(),
+            "temp_files": self._expire_temp_files(),
+            "avatars": self._expire_avatars(),
+        }
+        if any(stats.values()):
+            print("🧹 Storage GC:", ", ".join(f"{name}={count}" for name, count in stats.items()))
+        return stats
+
+    def _expire_jobs(self):
+        cutoff = time.time() - self.job_retention
+        placeholders = ", ".join("?" for _ in IN_FLIGHT_STATES)
+        rows = self.db.fetchall(f"""
+            SELECT id, image_sha, pdf_sha, audio_sha FROM jobs
+            WHERE state NOT IN ({placeholders}) AND finished_at < ?
+        """, (*IN_FLIGHT_STATES, cutoff))
+        for job_id, *shas in rows:
+            if self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)):
+                for sha in shas:
+                    if sha:
+                        self.blob_store.release(sha)
+        return len(rows)
+
+    def _enforce_quotas(self):
+        if not self.user_quota_bytes:
+            return 0
+        removed = 0
+        for (user_id,) in self.db.fetchall("SELECT DISTINCT user_id FROM videos"):
+            videos = self.db.fetchall(
+                "SELECT id, filename, poster FROM videos WHERE user_id = ? ORDER BY id DESC", (user_id,)
+            )
+            used = 0
+            for index, (video_id, filename, poster) in enumerate(videos):
+                paths = video_paths(self.upload_folder, filename, poster)
+                used += sum(disk_usage(path) for path in paths)
+                # The newest video always stays; everything from the first one over the quota goes.
+                if index > 0 and used > self.user_quota_bytes:
+                    for path in paths:
+                        remove_path(path)
+                    self.db.execute("DELETE FROM videos WHERE id = ?", (video_id,))
+                    removed += 1
+        return removed
+
+    def _live_paths(self):
+        keep = set()
+        for filename, poster in self.db.fetchall("SELECT filename, poster FROM videos"):
+            keep.update(os.path.abspath(path) for path in video_paths(self.upload_folder, filename, poster))
+        placeholders = ", ".join("?" for _ in IN_FLIGHT_STATES)
+        in_flight = self.db.fetchall(
+            f"SELECT result_dir, driven_audio FROM jobs WHERE state IN ({placeholders})", IN_FLIGHT_STATES
+        )
+        for result_dir, driven_audio in in_flight:
+            # Whole directories: the render is still writing into them.
+            for path in (result_dir, driven_audio and os.path.dirname(driven_audio)):
+                if path:
+                    keep.add(os.path.abspath(path))
+        return keep
+
+    def _collect_job_dirs(self):
+        keep = self._live_paths()
+        jobs_root = os.path.join(self.upload_folder, "jobs")
+        candidates = [os.path.join(jobs_root, name) for name in os.listdir(jobs_root)] if os.path.isdir(jobs_root) else []
+        candidates += [os.path.join(self.upload_folder, name) for name in os.listdir(self.upload_folder)
+                       if name not in RESERVED_DIRS]
+        now = time.time()
+        removed = 0
+        for job_dir in candidates:
+            job_dir = os.path.abspath(job_dir)
+            if not os.path.isdir(job_dir) or now - os.path.getmtime(job_dir) < self.grace or job_dir in keep:
+                continue
+            used = [path for path in keep if path.startswith(job_dir + os.sep)]
+            if not used:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                removed += 1
+                continue
+            for name in os.listdir(job_dir):
+                path = os.path.join(job_dir, name)
+                if path not in keep and not any(kept.startswith(path + os.sep) for kept in used):
+                    remove_path(path)
+                    removed += 1
+        return removed
+
+    def _expire_temp_files(self):
+        cutoff = time.time() - self.temp_max_age
+        removed = 0
+        for name in os.listdir(self.blob_store.tmp_dir):
+            path = os.path.join(self.blob_store.tmp_dir, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def _expire_avatars(self):
+        if not self.avatar_cache_dir or not os.path.isdir(self.avatar_cache_dir):
+            return 0
+        now = time.time()
+        removed = 0
+        for shard in os.listdir(self.avatar_cache_dir):
+            shard_dir = os.path.join(self.avatar_cache_dir, shard)
+            # Entries are touched on every hit; tmp/ only holds entries being written.
+            max_age = self.temp_max_age if shard == "tmp" else self.job_retention
+            for name in os.listdir(shard_dir) if os.path.isdir(shard_dir) else ():
+                entry = os.path.join(shard_dir, name)
+                if now - os.path.getmtime(entry) > max_age:
+                    shutil.rmtree(entry, ignore_errors=True)
+                    removed += 1
+        return removed
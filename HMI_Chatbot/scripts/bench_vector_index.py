@@ -0,0 +1,154 @@
+"""Benchmark the FlatIndex of flat_index.py against the per-request Chroma path.
+
+Both indexes get the same precomputed vectors, so the numbers compare index
+setup and query cost only; embedding time is reported separately.
+
+    python scripts/bench_vector_index.py --pdf manual.pdf
+    python scripts/bench_vector_index.py --synthetic 200000 --ivf-lists 1024
+
+Recall is measured against an exact float32 search.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from flat_index import FlatIndex
+
+
+class PrecomputedEmbeddings:
+    """Embeddings interface answering from a text -> vector table."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def embed_documents(self, texts):
+        return [self.table[text].tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.table[text].tolist()
+
+
+def pdf_workload(path, queries, device):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    pages = PyPDFLoader(path).load()
+    chunks = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=50).split_documents(pages)
+    rng = np.random.default_rng(0)
+    # A chunk's first sentence is a query with a known good answer.
+    query_texts = [chunks[i].page_content.split(".")[0] for i in rng.choice(len(chunks), min(queries, len(chunks)), replace=False)]
+    model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2", model_kwargs={"device": device})
+    started = time.perf_counter()
+    texts = [chunk.page_content for chunk in chunks]
+    table = dict(zip(texts, np.asarray(model.embed_documents(texts), dtype=np.float32)))
+    print(f"Embedded {len(chunks)} chunks of {len(pages)} pages in {time.perf_counter() - started:.2f}s")
+    table.update(zip(query_texts, np.asarray(model.embed_documents(query_texts), dtype=np.float32)))
+    return chunks, query_texts, table
+
+
+def synthetic_workload(count, dim, queries, clusters=256):
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((clusters, dim)) * 3
+    vectors = (centers[rng.integers(0, clusters, count)] + rng.standard_normal((count, dim))).astype(np.float32)
+    chunks = [Document(page_content=f"chunk {i}") for i in range(count)]
+    table = {chunk.page_content: vector for chunk, vector in zip(chunks, vectors)}
+    query_texts = [f"query {i}" for i in range(queries)]
+    for i, text in enumerate(query_texts):
+        table[text] = vectors[rng.integers(count)] + rng.standard_normal(dim).astype(np.float32) * 0.5
+    return chunks, query_texts, table
+
+
+def exact_top_k(chunks, query_texts, table, k):
+    matrix = np.stack([table[chunk.page_content] for chunk in chunks])
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    queries = np.stack([table[text] for text in query_texts])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return [set(row) for row in np.argsort(-(queries @ matrix.T), axis=1)[:, :k]]
+
+
+def report(name, setup, latencies, recall=None):
+    latencies = np.array(latencies) * 1e3
+    line = f"{name:<14} setup {setup * 1e3:9.1f} ms   query p50 {np.percentile(latencies, 50):7.2f} ms   p95 {np.percentile(latencies, 95):7.2f} ms"
+    if recall is not None:
+        line += f"   recall@k {recall:.3f}"
+    print(line)
+
+
+def bench_flat(name, chunks, query_texts, table, k, exact, ivf_lists=0, nprobe=8):
+    embeddings = PrecomputedEmbeddings(table)
+    positions = {chunk.page_content: i for i, chunk in enumerate(chunks)}
+    with tempfile.TemporaryDirectory() as path:
+        started = time.perf_counter()
+        index = FlatIndex.build(chunks, embeddings, path, ivf_lists=ivf_lists, nprobe=nprobe)
+        setup = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(path, "vectors.npy"))
+        latencies, hits = [], 0
+        for text, expected in zip(query_texts, exact):
+            started = time.perf_counter()
+            found = index.as_retriever(search_kwargs={"k": k}).invoke(text)
+            latencies.append(time.perf_counter() - started)
+            hits += len({positions[doc.page_content] for doc in found} & expected)
+        report(name, setup, latencies, hits / (k * len(query_texts)))
+        print(f"{'':<14} vectors.npy {size / 1024 / 1024:.1f} MB")
+
+
+def bench_chroma(chunks, query_texts, table, k, exact):
+    try:
+        from langchain_community.vectorstores import Chroma
+    except ImportError:
+        print("chroma         not installed, skipped")
+        return
+    positions = {chunk.page_content: i for i, chunk in enumerate(chunks)}
+    started = time.perf_counter()
+    # What rag.py did on every request: a fresh in-memory collection.
+    vectordb = Chroma.from_documents(chunks, embedding=PrecomputedEmbeddings(table))
+    setup = time.perf_counter() - started
+    latencies, hits = [], 0
+    for text, expected in zip(query_texts, exact):
+        started = time.perf_counter()
+        found = vectordb.as_retriever(search_kwargs={"k": k}).invoke(text)
+        latencies.append(time.perf_counter() - started)
+        hits += len({positions[doc.page_content] for doc in found} & expected)
+    report("chroma", setup, latencies, hits / (k * len(query_texts)))
+    vectordb.delete_collection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf", help="benchmark on the chunks of this PDF")
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark on this many random clustered vectors instead")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--ivf-lists", type=int, default=0, help="also benchmark an IVF index with this many partitions")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    if args.pdf:
+        chunks, query_texts, table = pdf_workload(args.pdf, args.queries, args.device)
+    elif args.synthetic:
+        chunks, query_texts, table = synthetic_workload(args.synthetic, args.dim, args.queries)
+    else:
+        parser.error("give --pdf or --synthetic")
+
+    exact = exact_top_k(chunks, query_texts, table, args.k)
+    print(f"{len(chunks)} chunks, {len(query_texts)} queries, k={args.k}")
+    bench_flat("flat", chunks, query_texts, table, args.k, exact)
+    if args.ivf_lists:
+        bench_flat(f"ivf {args.ivf_lists}/{args.nprobe}", chunks, query_texts, table, args.k, exact, args.ivf_lists, args.nprobe)
+    if not args.skip_chroma:
+        bench_chroma(chunks, query_texts, table, args.k, exact)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""HTTP clients for the RAG (rag.py) and XTTS (translate_xtts_api1.py) services.
+
+Used by inference3 when it runs the whole pipeline from the command line and
+by the job scheduler of rag_gui_api, which fetches the answer and its audio
+before a render is queued.  Documents are sent to the RAG service once
+(``/documents``) and referred to by id afterwards; the id is the SHA-256 of
+the PDF, so a caller never needs to remember which documents it registered.
+"""
+import hashlib
+import os
+import uuid
+import wave
+
+import requests
+
+
+def synthesize_tts_audio(text, source_lang, target_lang, reference_audio=None, output_dir="results/audio", timings=None):
+    """Send text to TTS API and return generated audio file path.
+
+    If ``timings`` is a dict it receives the translation and synthesis seconds reported by the service.
+    """
+    unique_id = str(uuid.uuid4())
+    tts_audio_path = os.path.join(output_dir, f"tts_output_{unique_id}.wav")
+    files = None
+
+    try:
+        data = {
+            "text": text,
+            "source_lang": source_lang,
+            "target_lang": target_lang
+        }
+        if reference_audio and os.path.isfile(reference_audio):
+            files = {"reference_audio": open(reference_audio, "rb")}
+
+        response = requests.post("http://localhost:7000/translate-and-speak", data=data, files=files)
+
+        if response.status_code == 200:
+            os.makedirs(os.path.dirname(tts_audio_path), exist_ok=True)
+            with open(tts_audio_path, "wb") as f:
+                f.write(response.content)
+            print(f"✅ Audio synthesized and saved to {tts_audio_path}")
+            if timings is not None:
+                for name, header in (("translate", "X-Translate-Seconds"), ("xtts", "X-Synthesis-Seconds")):
+                    if header in response.headers:
+                        timings[name] = float(response.headers[header])
+            return tts_audio_path
+        else:
+            print("❌ TTS API Error:", response.status_code, response.text)
+
+    except Exception as e:
+        print("❌ TTS API request failed:", str(e))
+
+    finally:
+        if files:
+            files["reference_audio"].close()
+
+    return None
+
+
+RAG_URL = "http://localhost:9100"
+
+
+def document_id(pdf_path):
+    """Id of a document in the RAG service: the SHA-256 of the PDF."""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def register_document(pdf_path, wait=True):
+    """Upload a PDF to the RAG service, returning its document id.
+
+    With ``wait=False`` the service indexes it in the background, see document_status.
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        response = requests.post(f"{RAG_URL}/documents", data={"wait": str(wait).lower()}, files={"pdf_file": pdf_file})
+    response.raise_for_status()
+    return response.json()["document_id"]
+
+
+def document_status(doc_id):
+    """{"status": "indexing" | "ready" | "error" | "unknown", ...} of a document in the RAG service."""
+    response = requests.get(f"{RAG_URL}/documents/{doc_id}")
+    response.raise_for_status()
+    return response.json()
+
+
+def _query_document(endpoint, pdf_path, data, doc_id=None):
+    """POST ``data`` with the document id, uploading the PDF once only if the service does not know it."""
+    doc_id = doc_id or document_id(pdf_path)
+    response = requests.post(f"{RAG_URL}/{endpoint}", data={**data, "document_id": doc_id})
+    if response.status_code == 404:
+        print(f"📄 Registering document {doc_id[:12]} with the RAG service")
+        doc_id = register_document(pdf_path)
+        response = requests.post(f"{RAG_URL}/{endpoint}", data={**data, "document_id": doc_id})
+    return response.json()
+
+
+def get_rag_answer(pdf_path, query, doc_id=None):
+    """``doc_id`` saves hashing the PDF when the caller already knows it."""
+    data = _query_document("rag-query", pdf_path, {"query": query}, doc_id)
+    if "answer" in data and isinstance(data["answer"], dict):
+        return data["answer"].get("result", None)  # ✅ only return the result string
+    return None
+
+
+def get_rag_answers(pdf_path, queries, doc_id=None):
+    """Answers to several queries about one document, in order; None for a query without one."""
+    data = _query_document("rag-batch-query", pdf_path, {"queries": list(queries)}, doc_id)
+    answers = data.get("answers") or [None] * len(queries)
+    return [answer.get("result") if isinstance(answer, dict) else None for answer in answers]
+
+
+def audio_duration(path):
+    """Length of a WAV file in seconds, or None if it cannot be read."""
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / float(f.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
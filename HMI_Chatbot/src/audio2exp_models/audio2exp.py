@@ -1,4 +1,4 @@
-from tqdm import tqdm
+from src.utils.progress import track
 import torch
 from torch import nn
 
@@ -18,7 +18,7 @@ class Audio2Exp(nn.Module):
 
         exp_coeff_pred = []
 
-        for i in tqdm(range(0, T, 10),'audio2exp:'): # every 10 frames
+        for i in track(range(0, T, 10),'audio2exp:', 'audio2coeff'): # every 10 frames
             
             current_mel_input = mel_input[:,i:i+10]
 
@@ -2,7 +2,7 @@ from scipy.spatial import ConvexHull
 import torch
 import torch.nn.functional as F
 import numpy as np
-from tqdm import tqdm 
+from src.utils.progress import track
 
 def normalize_kp(kp_source, kp_driving, kp_driving_initial, adapt_movement_scale=False,
                  use_relative_movement=False, use_relative_jacobian=False):
@@ -110,7 +110,7 @@ def make_animation(source_image, source_semantics, target_semantics,
         he_source = mapping(source_semantics)
         kp_source = keypoint_transformation(kp_canonical, he_source)
     
-        for frame_idx in tqdm(range(target_semantics.shape[1]), 'Face Renderer:'):
+        for frame_idx in track(range(target_semantics.shape[1]), 'Face Renderer:', 'face_render'):
             # still check the dimension
             # print(target_semantics.shape, source_semantics.shape)
             target_semantics_frame = target_semantics[:, frame_idx]
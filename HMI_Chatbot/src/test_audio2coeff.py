@@ -12,6 +12,7 @@ from src.audio2pose_models.audio2pose import Audio2Pose
 from src.audio2exp_models.networks import SimpleWrapperV2 
 from src.audio2exp_models.audio2exp import Audio2Exp
 from src.utils.safetensor_helper import load_x_from_safetensor  
+from src.utils.progress import span
 
 def load_cpk(checkpoint_path, model=None, optimizer=None, device="cpu"):
     checkpoint = torch.load(checkpoint_path, map_location=torch.device(device))
@@ -75,14 +76,16 @@ class Audio2Coeff():
 
         with torch.no_grad():
             #test
-            results_dict_exp= self.audio2exp_model.test(batch)
+            with span('audio2exp'):
+                results_dict_exp= self.audio2exp_model.test(batch)
             exp_pred = results_dict_exp['exp_coeff_pred']                         #bs T 64
 
             #for class_id in  range(1):
             #class_id = 0#(i+10)%45
             #class_id = random.randint(0,46)                                   #46 styles can be selected 
             batch['class'] = torch.LongTensor([pose_style]).to(self.device)
-            results_dict_pose = self.audio2pose_model.test(batch) 
+            with span('audio2pose'):
+                results_dict_pose = self.audio2pose_model.test(batch) 
             pose_pred = results_dict_pose['pose_pred']                        #bs T 6
 
             pose_len = pose_pred.shape[1]
@@ -0,0 +1,76 @@
+"""Reuse of the 3DMM extraction of a source image across renders.
+
+CropAndExtract.generate (face crop, landmarks and the 3DMM fit) only depends
+on the image content, the preprocess mode and the size, so its outputs are
+kept under ``cache_dir/<key>/`` and copied into the render's own directory
+when the same avatar comes back, e.g. for every answer of a batch.  Entries
+are written to a temporary directory and renamed into place, so concurrent
+workers never see half an entry.  A hit touches the entry; expiring unused
+ones is left to the owner of ``cache_dir`` (see retention.py).
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_json(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return [_to_json(item) for item in value]
+
+
+def _restore(entry, save_dir):
+    with open(os.path.join(entry, "entry.json")) as f:
+        meta = json.load(f)
+    for name in os.listdir(entry):
+        if name != "entry.json":
+            shutil.copy(os.path.join(entry, name), save_dir)
+    os.utime(entry)
+    return os.path.join(save_dir, meta["coeff"]), os.path.join(save_dir, meta["png"]), meta["crop_info"]
+
+
+def cached_preprocess(preprocess_model, pic_path, save_dir, preprocess, size, cache_dir=None):
+    """CropAndExtract.generate for a source image, answered from ``cache_dir`` when possible."""
+    if not cache_dir:
+        return preprocess_model.generate(pic_path, save_dir, preprocess, source_image_flag=True, pic_size=size)
+
+    key = hashlib.sha256(f"{_file_sha256(pic_path)}:{preprocess}:{size}".encode()).hexdigest()
+    entry = os.path.join(cache_dir, key[:2], key)
+    if os.path.isfile(os.path.join(entry, "entry.json")):
+        print(' 3DMM coefficients reused from the avatar cache')
+        return _restore(entry, save_dir)
+
+    coeff_path, png_path, crop_info = preprocess_model.generate(pic_path, save_dir, preprocess, source_image_flag=True, pic_size=size)
+    if coeff_path is None:
+        return coeff_path, png_path, crop_info
+
+    tmp = os.path.join(cache_dir, "tmp", uuid.uuid4().hex)
+    os.makedirs(tmp)
+    for name in os.listdir(save_dir):
+        if os.path.isfile(os.path.join(save_dir, name)):
+            shutil.copy(os.path.join(save_dir, name), tmp)
+    with open(os.path.join(tmp, "entry.json"), "w") as f:
+        json.dump({
+            "coeff": os.path.basename(coeff_path),
+            "png": os.path.basename(png_path),
+            "crop_info": _to_json(crop_info),
+        }, f)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # Another worker cached the same avatar first.
+        shutil.rmtree(tmp, ignore_errors=True)
+    return coeff_path, png_path, crop_info
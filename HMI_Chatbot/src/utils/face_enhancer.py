@@ -3,7 +3,7 @@ import torch
 
 from gfpgan import GFPGANer
 
-from tqdm import tqdm
+from src.utils.progress import track
 
 from src.utils.videoio import load_video_to_cv2
 
@@ -108,7 +108,7 @@ def enhancer_generator_no_len(images, method='gfpgan', bg_upsampler='realesrgan'
         bg_upsampler=bg_upsampler)
 
     # ------------------------ restore ------------------------
-    for idx in tqdm(range(len(images)), 'Face Enhancer:'):
+    for idx in track(range(len(images)), 'Face Enhancer:', 'enhancer'):
         
         img = cv2.cvtColor(images[idx], cv2.COLOR_RGB2BGR)
         
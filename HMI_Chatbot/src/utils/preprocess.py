@@ -1,6 +1,6 @@
 import numpy as np
 import cv2, os, sys, torch
-from tqdm import tqdm
+from src.utils.progress import track, span
 from PIL import Image 
 
 # 3dmm extraction
@@ -93,14 +93,16 @@ class CropAndExtract():
 
         #### crop images as the 
         if 'crop' in crop_or_resize.lower(): # default crop
-            x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
+            with span('face_crop'):
+                x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
             clx, cly, crx, cry = crop
             lx, ly, rx, ry = quad
             lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
             oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
             crop_info = ((ox2 - ox1, oy2 - oy1), crop, quad)
         elif 'full' in crop_or_resize.lower():
-            x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
+            with span('face_crop'):
+                x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
             clx, cly, crx, cry = crop
             lx, ly, rx, ry = quad
             lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
@@ -121,7 +123,8 @@ class CropAndExtract():
 
         # 2. get the landmark according to the detected face. 
         if not os.path.isfile(landmarks_path): 
-            lm = self.propress.predictor.extract_keypoint(frames_pil, landmarks_path)
+            with span('landmarks'):
+                lm = self.propress.predictor.extract_keypoint(frames_pil, landmarks_path)
         else:
             print(' Using saved landmarks.')
             lm = np.loadtxt(landmarks_path).astype(np.float32)
@@ -130,7 +133,7 @@ class CropAndExtract():
         if not os.path.isfile(coeff_path):
             # load 3dmm paramter generator from Deep3DFaceRecon_pytorch 
             video_coeffs, full_coeffs = [],  []
-            for idx in tqdm(range(len(frames_pil)), desc='3DMM Extraction In Video:'):
+            for idx in track(range(len(frames_pil)), '3DMM Extraction In Video:', '3dmm'):
                 frame = frames_pil[idx]
                 W,H = frame.size
                 lm1 = lm[idx].reshape([-1, 2])
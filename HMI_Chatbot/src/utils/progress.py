@@ -0,0 +1,96 @@
+"""Stage and progress reporting for the inference pipeline.
+
+The pipeline code marks its stages with ``stage(name)`` and wraps its frame
+loops with ``track(...)`` instead of a bare tqdm.  Anything interested in the
+progress of the current job (the worker pool, a trace recorder, ...) registers
+a listener and receives plain dict events; without listeners this only adds
+the tqdm bar that was there before.
+
+Finer ``span(name)`` sections (and every iteration of a ``track`` loop) are
+only reported to listeners registered with ``spans=True``, see
+src/utils/trace.py.
+"""
+import time
+from contextlib import contextmanager
+
+from tqdm import tqdm
+
+# Pipeline stages in execution order with their rough share of the wall clock.
+STAGES = [
+    ("rag", 0.10),
+    ("tts", 0.10),
+    ("3dmm", 0.05),
+    ("audio2coeff", 0.05),
+    ("face_render", 0.45),
+    ("paste", 0.10),
+    ("enhancer", 0.10),
+    ("mux", 0.05),
+]
+
+_listeners = []
+_span_listeners = []
+
+
+def add_listener(listener, spans=False):
+    _listeners.append(listener)
+    if spans:
+        _span_listeners.append(listener)
+
+
+def remove_listener(listener):
+    for listeners in (_listeners, _span_listeners):
+        if listener in listeners:
+            listeners.remove(listener)
+
+
+def _emit(event, listeners=_listeners):
+    for listener in list(listeners):
+        listener(event)
+
+
+def overall_percent(stage_name, fraction):
+    """Map the fraction done inside a stage to a percentage of the whole job."""
+    done = 0.
+    for name, weight in STAGES:
+        if name == stage_name:
+            return round(100 * (done + weight * fraction), 1)
+        done += weight
+    return round(100 * done, 1)
+
+
+@contextmanager
+def stage(name):
+    _emit({"type": "stage", "stage": name, "state": "start", "time": time.time()})
+    try:
+        yield
+    finally:
+        _emit({"type": "stage", "stage": name, "state": "end", "time": time.time()})
+
+
+@contextmanager
+def span(name, **args):
+    """A sub-stage; costs nothing unless a span listener is registered."""
+    if not _span_listeners:
+        yield
+        return
+    _emit({"type": "span", "name": name, "state": "start", "time": time.time(), "args": args}, _span_listeners)
+    try:
+        yield
+    finally:
+        _emit({"type": "span", "name": name, "state": "end", "time": time.time(), "args": args}, _span_listeners)
+
+
+def track(iterable, desc, stage_name, total=None):
+    """tqdm replacement that also reports the fraction done of ``stage_name``."""
+    if total is None:
+        total = len(iterable)
+    reported = 0.
+    span_name = desc.rstrip(": ")
+    for idx, item in enumerate(tqdm(iterable, desc, total=total)):
+        with span(span_name, index=idx):
+            yield item
+        fraction = (idx + 1) / total if total else 1.
+        # Only report every 2% so a long render does not flood the listeners.
+        if fraction - reported >= 0.02 or fraction >= 1.:
+            reported = fraction
+            _emit({"type": "progress", "stage": stage_name, "fraction": fraction, "time": time.time()})
@@ -0,0 +1,58 @@
+"""Chrome trace export for one inference3 run (``--trace out.json``).
+
+The recorder listens to the stage and span events of src/utils/progress.py
+and writes them as Trace Event Format begin/end pairs, which chrome://tracing
+and Perfetto open directly.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from src.utils.progress import add_listener, remove_listener
+
+
+class TraceRecorder:
+
+    def __init__(self):
+        self.events = []
+        self._pid = os.getpid()
+
+    def __call__(self, event):
+        if event["type"] == "stage":
+            name, category, args = event["stage"], "stage", {}
+        elif event["type"] == "span":
+            name, category, args = event["name"], "span", event["args"]
+        else:
+            return
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "B" if event["state"] == "start" else "E",
+            "ts": event["time"] * 1e6,
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def save(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+
+@contextmanager
+def tracing(path):
+    """Record every stage and span inside the block to ``path``; does nothing if ``path`` is empty."""
+    if not path:
+        yield None
+        return
+    recorder = TraceRecorder()
+    add_listener(recorder, spans=True)
+    try:
+        yield recorder
+    finally:
+        remove_listener(recorder)
+        recorder.save(path)
+        print(f" Trace written to {path}")
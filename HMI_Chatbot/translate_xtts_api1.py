@@ -6,6 +6,7 @@ from googletrans import Translator
 import tempfile
 import shutil
 import os
+import time
 import torch
 from pydub import AudioSegment
 
@@ -63,7 +64,9 @@ async def translate_and_speak(
         if target_lang not in SUPPORTED_LANGUAGES:
             raise HTTPException(status_code=400, detail=f"Unsupported language: {target_lang}")
 
+        translate_started = time.perf_counter()
         translated_text = translator.translate(text, src=source_lang, dest=target_lang).text
+        translate_seconds = time.perf_counter() - translate_started
         print(f"🗣️ Translated: {translated_text}")
 
         if reference_audio and reference_audio.filename:
@@ -81,12 +84,14 @@ async def translate_and_speak(
         output_path = os.path.join(tempfile.gettempdir(), f"{next(tempfile._get_candidate_names())}.wav")
         print(f"🔁 Synthesizing to: {output_path}")
 
+        synthesis_started = time.perf_counter()
         tts.tts_to_file(
             text=translated_text,
             speaker_wav=speaker_wav_path,
             language=target_lang,
             file_path=output_path
         )
+        synthesis_seconds = time.perf_counter() - synthesis_started
         print("✅ TTS synthesis complete")
 
         if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
@@ -96,6 +101,10 @@ async def translate_and_speak(
             output_path,
             media_type="audio/wav",
             filename="translated_tts.wav",
+            headers={
+                "X-Translate-Seconds": f"{translate_seconds:.3f}",
+                "X-Synthesis-Seconds": f"{synthesis_seconds:.3f}",
+            },
             background=BackgroundTask(os.remove, output_path)
         )
 
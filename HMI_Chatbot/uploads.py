@@ -0,0 +1,126 @@
+"""Upload persistence for rag_gui_api.
+
+Uploaded files are copied to disk in fixed-size chunks on a worker thread, so
+a large PDF or voice sample neither sits in memory as one bytes object nor
+blocks the event loop.  The SHA-256 of the content is computed while copying
+and every field has its own size limit.  Inputs are then kept once per
+content hash in the BlobStore, however many jobs use them.
+"""
+import hashlib
+import os
+import time
+import uuid
+from collections import namedtuple
+
+from starlette.concurrency import run_in_threadpool
+
+CHUNK_SIZE = 1024 * 1024
+
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_DOCUMENT_BYTES = 100 * 1024 * 1024
+MAX_AUDIO_BYTES = 50 * 1024 * 1024
+
+StoredUpload = namedtuple("StoredUpload", ["path", "sha256", "size"])
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, filename, limit):
+        super().__init__(f"{filename} exceeds the {limit // (1024 * 1024)} MB upload limit")
+        self.filename = filename
+        self.limit = limit
+
+
+def _copy_in_chunks(src, path, filename, max_bytes):
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(filename, max_bytes)
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return digest.hexdigest(), size
+
+
+async def save_upload(upload, dest_dir, name, max_bytes):
+    """Stream ``upload`` to ``dest_dir/name<ext>`` and return a StoredUpload."""
+    ext = os.path.splitext(upload.filename or "")[1]
+    path = os.path.join(dest_dir, name + ext)
+    sha256, size = await run_in_threadpool(_copy_in_chunks, upload.file, path, upload.filename, max_bytes)
+    return StoredUpload(path, sha256, size)
+
+
+def init_blobs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT,
+            size INTEGER,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at REAL
+        )
+    """)
+
+
+class BlobStore:
+    """Content-addressed store for uploaded inputs.
+
+    Every distinct file is kept once under ``root/<sha[:2]>/<sha><ext>``; the
+    ``blobs`` table counts the jobs pointing at it.  ``put`` hands out one
+    reference (``retain`` more) and ``release`` drops one, deleting the file
+    with the last one.
+    """
+
+    def __init__(self, root, db):
+        self.root = root
+        self.db = db
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    async def put(self, upload, max_bytes):
+        tmp = await save_upload(upload, self.tmp_dir, uuid.uuid4().hex, max_bytes)
+        ext = os.path.splitext(tmp.path)[1].lower()
+        path = await run_in_threadpool(self._commit, tmp, ext)
+        return StoredUpload(path, tmp.sha256, tmp.size)
+
+    def _commit(self, tmp, ext):
+        with self.db.connection() as conn:
+            # Serialise against release() so a blob is never deleted while being re-used.
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT path FROM blobs WHERE sha256 = ?", (tmp.sha256,)).fetchone()
+            if row and os.path.exists(row[0]):
+                os.remove(tmp.path)
+                path = row[0]
+            else:
+                path = os.path.join(self.root, tmp.sha256[:2], tmp.sha256 + ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp.path, path)
+            conn.execute("""
+                INSERT INTO blobs (sha256, path, size, refcount, created_at) VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(sha256) DO UPDATE SET path = excluded.path, refcount = refcount + 1
+            """, (tmp.sha256, path, tmp.size, time.time()))
+        return path
+
+    def retain(self, sha256, count=1):
+        """Hand out ``count`` more references to a blob already held by the caller."""
+        with self.db.connection() as conn:
+            conn.execute("UPDATE blobs SET refcount = refcount + ? WHERE sha256 = ?", (count, sha256))
+
+    def release(self, sha256):
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ? AND refcount > 0", (sha256,))
+            row = conn.execute("SELECT path FROM blobs WHERE sha256 = ? AND refcount = 0", (sha256,)).fetchone()
+            if row:
+                if os.path.exists(row[0]):
+                    os.remove(row[0])
+                conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
@@ -0,0 +1,216 @@
+"""Resident inference workers for rag_gui_api.
+
+Every worker is a long-lived process that imports inference3 once, loads the
+SadTalker models on start-up and then keeps taking jobs from a local queue.
+A job runs ``inference3.main(args)`` in-process, so the torch import and the
+checkpoint loading are paid once per worker instead of once per video.  Stage
+and progress events of the running job are sent back over the event queue.
+"""
+import multiprocessing as mp
+import queue
+import threading
+import traceback
+from concurrent.futures import Future
+
+
+def _worker_loop(worker_id, device, task_queue, event_queue, control_queue):
+    import torch
+    import inference3
+    from src.utils import progress
+
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    parser = inference3.build_parser()
+
+    # Warm up with the default configuration so the first job does not pay for it.
+    defaults = parser.parse_args([])
+    defaults.device = device
+    inference3.load_models(defaults)
+    print(f"🧠 Worker {worker_id} ready on {device}")
+    event_queue.put(("ready", worker_id, None))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        job_id, options = task
+        # Wait for the pool to record the job as ours, so a crash mid-job is charged to it;
+        # a job cancelled while it was still queued is skipped.
+        event_queue.put(("started", job_id, worker_id))
+        if not control_queue.get():
+            continue
+        listener = lambda event, job_id=job_id: event_queue.put(("progress", job_id, event))
+        progress.add_listener(listener)
+        try:
+            args = parser.parse_args([])
+            for key, value in options.items():
+                setattr(args, key, value)
+            args.device = device
+            result = inference3.main(args)
+            if result:
+                event_queue.put(("done", job_id, result))
+            else:
+                event_queue.put(("error", job_id, "inference produced no video"))
+        except Exception as e:
+            traceback.print_exc()
+            event_queue.put(("error", job_id, str(e)))
+        finally:
+            progress.remove_listener(listener)
+
+
+def _resolve(setter, value):
+    threading.Thread(target=setter, args=(value,), name="pool-result", daemon=True).start()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class InferenceWorkerPool:
+    """A fixed set of model-holding processes fed through a shared task queue per device.
+
+    Each worker reports back over its own event queue, so a worker can be killed
+    mid-job (see ``cancel``) without corrupting a queue the others still use.
+    Futures are resolved on threads of their own: their callbacks (recording
+    the video, posters, HLS) must neither keep a worker from its next job nor
+    hold up the result of another one.
+    """
+
+    def __init__(self, devices=("auto",), workers_per_device=1, on_progress=None):
+        self.devices = list(devices)
+        self.workers_per_device = workers_per_device
+        self.on_progress = on_progress  # (job_id, event) -> None
+        # CUDA cannot be re-initialised in a forked child, always spawn.
+        self._ctx = mp.get_context("spawn")
+        self._task_queues = {device: self._ctx.Queue() for device in self.devices}
+        self._workers = []
+        self._next_worker_id = 0
+        self._futures = {}
+        self._cancelled = set()
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        for device in self.devices:
+            for _ in range(self.workers_per_device):
+                self._spawn(device)
+
+    def _spawn(self, device):
+        events = self._ctx.Queue()
+        control = self._ctx.Queue()
+        worker = {"id": self._next_worker_id, "device": device, "events": events, "control": control,
+                  "job_id": None, "ready": False}
+        self._next_worker_id += 1
+        worker["process"] = self._ctx.Process(
+            target=_worker_loop,
+            args=(worker["id"], device, self._task_queues[device], events, control),
+            daemon=True,
+        )
+        worker["process"].start()
+        self._workers.append(worker)
+        threading.Thread(target=self._listen, args=(worker,), daemon=True).start()
+
+    def submit(self, job_id, options, device=None):
+        """Queue a job and return a Future resolving to the generated video path."""
+        future = Future()
+        with self._lock:
+            self._futures[job_id] = future
+        self._task_queues[device or self.devices[0]].put((job_id, options))
+        return future
+
+    def busy_workers(self):
+        return sum(1 for worker in self._workers if worker["job_id"] is not None)
+
+    def cancel(self, job_id):
+        """Stop ``job_id``, killing and replacing its worker if it already started."""
+        with self._lock:
+            future = self._futures.pop(job_id, None)
+            if future is None:
+                return False
+            worker = next((w for w in self._workers if w["job_id"] == job_id), None)
+            if worker is None:
+                # Still in the task queue: the worker that picks it up skips it.
+                self._cancelled.add(job_id)
+            else:
+                self._workers.remove(worker)
+        if worker is not None:
+            self._replace(worker)
+        future.set_exception(JobCancelled(job_id))
+        return True
+
+    def _replace(self, worker):
+        """Kill a worker already taken out of ``_workers`` and start a new one once it is gone."""
+        print(f"🛑 Stopping worker {worker['id']} (job {worker['job_id']})")
+        worker["process"].terminate()
+        worker["process"].join(timeout=10)
+        with self._lock:
+            if not self._closing:
+                self._spawn(worker["device"])
+
+    def _lost(self, worker):
+        """Fail the job of a worker that died on its own (OOM, CUDA abort, ...) and start a replacement."""
+        with self._lock:
+            if self._closing or worker not in self._workers:
+                # Shut down or terminated on purpose by _replace.
+                return
+            self._workers.remove(worker)
+            future = self._futures.pop(worker["job_id"], None)
+            exitcode = worker["process"].exitcode
+            print(f"💥 Worker {worker['id']} on {worker['device']} exited unexpectedly (exit code {exitcode})")
+            # A worker that could not even load the models would only crash again.
+            if worker["ready"]:
+                self._spawn(worker["device"])
+        if future is not None:
+            _resolve(future.set_exception, RuntimeError(f"inference worker exited unexpectedly (exit code {exitcode})"))
+
+    def _listen(self, worker):
+        while True:
+            try:
+                event = worker["events"].get(timeout=1)
+            except queue.Empty:
+                if not worker["process"].is_alive():
+                    self._lost(worker)
+                    break
+                continue
+            except (EOFError, OSError):
+                self._lost(worker)
+                break
+            kind, key, payload = event
+            if kind == "ready":
+                worker["ready"] = True
+                continue
+            if kind == "started":
+                with self._lock:
+                    skip = key in self._cancelled
+                    if skip:
+                        self._cancelled.discard(key)
+                    else:
+                        worker["job_id"] = key
+                worker["control"].put(not skip)
+                continue
+            if kind == "progress":
+                if self.on_progress:
+                    try:
+                        self.on_progress(key, payload)
+                    except Exception:
+                        traceback.print_exc()
+                continue
+            with self._lock:
+                worker["job_id"] = None
+                future = self._futures.pop(key, None)
+            if future is None:
+                continue
+            if kind == "done":
+                _resolve(future.set_result, payload)
+            else:
+                _resolve(future.set_exception, RuntimeError(payload))
+
+    def shutdown(self):
+        self._closing = True
+        for device in self.devices:
+            for _ in range(self.workers_per_device):
+                self._task_queues[device].put(None)
+        for worker in list(self._workers):
+            worker["process"].join(timeout=10)
+            if worker["process"].is_alive():
+                worker["process"].terminate()